@@ -0,0 +1,118 @@
+#!/usr/bin/python
+# coding=utf-8
+#
+# Check the peak memory used by the commands on a generated dictionary.
+#
+# Copyright (C) 2017 Reece H. Dunn
+#
+# This file is part of cmudict-tools.
+#
+# cmudict-tools is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# cmudict-tools is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with cmudict-tools.  If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import print_function
+
+import os
+import re
+import sys
+import random
+import tempfile
+import subprocess
+
+root = os.path.join(os.path.dirname(os.path.realpath(__file__)), '..')
+
+# The peak memory budget for each command, in bytes per dictionary entry. The
+# peak memory of the same command on a small dictionary is subtracted first, so
+# the fixed start-up overhead (modules, phonesets, ...) is not counted.
+budgets = [
+	('validate',          ['validate', '{base}'],                 64),
+	('print',             ['print', '{base}'],                    64),
+	('print --sort=weide', ['--sort=weide', 'print', '{base}'],  500),
+	('stats=all',         ['stats=all', '{base}'],                64),
+	('delta',             ['delta', '{base}', '{target}'],       600),
+	('patch',             ['patch', '{base}', '{delta}'],         64),
+	('diff',              ['diff', '{base}', '{target}'],         32),
+	('merge (conflicts)', ['merge', '{conflicts}'],               64),
+]
+
+baseline_count = 1000
+
+re_peak = re.compile(r'^Peak memory: ([0-9.]+) KiB$', re.M)
+
+def generate_entries(count, seed=0):
+	rng = random.Random(seed)
+	consonants = ['B', 'D', 'F', 'G', 'K', 'L', 'M', 'N', 'P', 'R', 'S', 'T', 'V', 'Z']
+	vowels = ['AA', 'AE', 'AH', 'EH', 'IH', 'IY', 'OW', 'UW']
+	words = set('ABCDEFGHIJKLMNOPQRSTUVWXYZ') # prefixes of the other words, like `A` in cmudict
+	while len(words) < count:
+		words.add(''.join(rng.choice('ABCDEFGHIJKLMNOPQRSTUVWXYZ') for _ in range(rng.randint(3, 12))))
+	entries = []
+	for word in sorted(words):
+		phonemes = [rng.choice(consonants), '{0}1'.format(rng.choice(vowels))]
+		for _ in range(rng.randint(0, 3)):
+			phonemes.extend([rng.choice(consonants), '{0}0'.format(rng.choice(vowels))])
+		entries.append('{0}  {1}'.format(word, ' '.join(phonemes)))
+	return entries
+
+def write_lines(path, lines):
+	with open(path, 'w') as f:
+		for line in lines:
+			f.write('{0}\n'.format(line))
+	return path
+
+def create_files(directory, count):
+	entries = generate_entries(count)
+	header = [';;;@@ sorting=weide @@']
+	target = [line.replace('AH0', 'IH0') if i % 100 == 0 else line for i, line in enumerate(entries)]
+	conflicts = []
+	for i, line in enumerate(entries):
+		if i % 10000 == 5000:
+			conflicts.extend(['<<<<<<< HEAD', line, '=======', target[i], '>>>>>>> branch'])
+		else:
+			conflicts.append(line)
+	files = {
+		'base': write_lines(os.path.join(directory, 'base.dict'), header + entries),
+		'target': write_lines(os.path.join(directory, 'target.dict'), header + target),
+		'conflicts': write_lines(os.path.join(directory, 'conflicts.dict'), header + conflicts),
+	}
+	with open(os.path.join(directory, 'delta'), 'wb') as f:
+		subprocess.check_call([sys.executable, os.path.join(root, 'cmudict-tools'), 'delta', files['base'], files['target']], stdout=f)
+	files['delta'] = os.path.join(directory, 'delta')
+	return files
+
+def measure(args, files):
+	command = [sys.executable, os.path.join(root, 'cmudict-tools'), '--memory-report'] + [arg.format(**files) for arg in args]
+	with open(os.devnull, 'wb') as devnull:
+		process = subprocess.Popen(command, stdout=devnull, stderr=subprocess.PIPE)
+		_, report = process.communicate()
+	m = re_peak.search(report.decode('utf-8'))
+	if not m:
+		raise Exception('no memory report from: {0}'.format(' '.join(command)))
+	return float(m.group(1)) * 1024
+
+count = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+if count <= baseline_count:
+	raise Exception('the entry count must be more than {0}'.format(baseline_count))
+baseline = create_files(tempfile.mkdtemp(), baseline_count)
+files = create_files(tempfile.mkdtemp(), count)
+print('{0} entries ({1} entry baseline)'.format(count, baseline_count))
+failed = 0
+for name, args, budget in budgets:
+	base = measure(args, baseline)
+	peak = measure(args, files)
+	per_entry = (peak - base) / (count - baseline_count)
+	status = 'ok' if per_entry <= budget else 'OVER BUDGET'
+	if per_entry > budget:
+		failed = failed + 1
+	print('{0: <20}{1: >12.1f} KiB{2: >12.1f} KiB base{3: >8.1f} bytes/entry (budget {4}) {5}'.format(name, peak / 1024.0, base / 1024.0, per_entry, budget, status))
+sys.exit(1 if failed else 0)
@@ -0,0 +1,79 @@
+#!/usr/bin/python
+# coding=utf-8
+#
+# Benchmark parsing the entry metadata with and without the metastring cache.
+#
+# Copyright (C) 2017 Reece H. Dunn
+#
+# This file is part of cmudict-tools.
+#
+# cmudict-tools is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# cmudict-tools is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with cmudict-tools.  If not, see <http://www.gnu.org/licenses/>.
+
+
+from __future__ import print_function
+
+import os
+import sys
+import random
+import timeit
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+
+from cmudicttools import cmudict
+from cmudicttools import metadata
+
+def generate_entries(count, seed=0):
+	rng = random.Random(seed)
+	tags = ['NN', 'NNS', 'VB', 'VBD', 'VBG', 'JJ', 'RB']
+	metastrings = [
+		'pos={0}',
+		'pos={0} disable-warnings=missing-stress',
+		'pos={0} stem=@',
+	]
+	entries = [';;;@@ metadata=@s:pos metadata=@s:disable-warnings metadata=@s:stem @@']
+	for i in range(count):
+		meta = rng.choice(metastrings).format(rng.choice(tags))
+		entries.append('W{0:07d}  B AH1 T #@@ {1} @@'.format(i, meta))
+	return entries
+
+def measure(name, parse_key_values, path):
+	parser = metadata.parse_key_values
+	metadata.parse_key_values = parse_key_values
+	try:
+		elapsed = min(timeit.repeat(lambda: list(cmudict.parse(path, warnings=['none'])), number=1, repeat=3))
+	finally:
+		metadata.parse_key_values = parser
+	print('{0: <28}{1: >12.3f} us/entry'.format(name, elapsed * 1e6 / count))
+	return elapsed
+
+count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+path = os.path.join(tempfile.mkdtemp(), 'annotated.dict')
+with open(path, 'w') as f:
+	for line in generate_entries(count):
+		f.write('{0}\n'.format(line))
+print('{0} annotated entries'.format(count))
+
+metastrings = [line.split('@@')[1] for line in generate_entries(count)[1:]]
+validators = metadata.FrozenMetadata([(key, cmudict.TypeValidator('s')) for key in ['pos', 'disable-warnings', 'stem']])
+timings = []
+for name, parse_key_values in [('uncached', metadata.parse_key_values.uncached), ('cached', metadata.parse_key_values)]:
+	elapsed = min(timeit.repeat(lambda: [parse_key_values(m, validators) for m in metastrings], number=1, repeat=3))
+	print('{0: <28}{1: >12.3f} us/metastring'.format('parse_key_values ({0})'.format(name), elapsed * 1e6 / count))
+	timings.append(elapsed)
+print('{0: <28}{1: >12.2f}x'.format('parse_key_values speedup', timings[0] / timings[1]))
+timings = []
+for name, parse_key_values in [('uncached', metadata.parse_key_values.uncached), ('cached', metadata.parse_key_values)]:
+	timings.append(measure('parse ({0})'.format(name), parse_key_values, path))
+print('{0: <28}{1: >12.2f}x'.format('parse speedup', timings[0] / timings[1]))
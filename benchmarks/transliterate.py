@@ -0,0 +1,54 @@
+#!/usr/bin/python
+# coding=utf-8
+#
+# Benchmark converting pronunciations to IPA in bulk.
+#
+# Copyright (C) 2017 Reece H. Dunn
+#
+# This file is part of cmudict-tools.
+#
+# cmudict-tools is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# cmudict-tools is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with cmudict-tools.  If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import print_function
+
+import os
+import sys
+import random
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+
+from cmudicttools import cmudict
+
+def generate_pronunciations(count, unique, seed=0):
+	rng = random.Random(seed)
+	phonemes = sorted(cmudict.load_phonemes('en-US', 'cmu').to_arpabet.values())
+	distinct = [tuple(rng.choice(phonemes) for _ in range(rng.randint(2, 10))) for _ in range(unique)]
+	return [rng.choice(distinct) for _ in range(count)]
+
+def measure(name, convert, pronunciations):
+	elapsed = min(timeit.repeat(lambda: convert(pronunciations), number=1, repeat=3))
+	print('{0: <28}{1: >12.3f} us/pronunciation'.format(name, elapsed * 1e6 / len(pronunciations)))
+
+count = int(sys.argv[1]) if len(sys.argv) > 1 else 500000
+pronunciations = generate_pronunciations(count, count // 10)
+print('{0} pronunciations'.format(len(pronunciations)))
+
+ipa = cmudict.load_phonemes('en-US', 'ipa')
+measure('IpaPhonemeSet.format', lambda p: [ipa.format(x) for x in p], pronunciations)
+converter = cmudict.PhonemeConverter('en-US', None, 'ipa')
+measure('PhonemeConverter.format', lambda p: [converter.format(x) for x in p], pronunciations)
+for result in ['list', 'generator', 'columnar']:
+	converter = cmudict.PhonemeConverter('en-US', None, 'ipa')
+	measure('transliterate ({0})'.format(result), lambda p: list(converter.transliterate(p, result)) if result == 'generator' else converter.transliterate(p, result), pronunciations)
@@ -0,0 +1,82 @@
+#!/usr/bin/python
+# coding=utf-8
+#
+# Benchmark the WordList memory use and lookup speed.
+#
+# Copyright (C) 2017 Reece H. Dunn
+#
+# This file is part of cmudict-tools.
+#
+# cmudict-tools is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# cmudict-tools is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with cmudict-tools.  If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import print_function
+
+import os
+import sys
+import random
+import timeit
+import tempfile
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+
+from cmudicttools import cmudict
+
+def generate_words(count, seed=0):
+	rng = random.Random(seed)
+	letters = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+	words = set()
+	while len(words) < count:
+		words.add(''.join(rng.choice(letters) for _ in range(rng.randint(2, 12))))
+	return sorted(words)
+
+def create_trie(words):
+	root = {}
+	for word in words:
+		current = root
+		for letter in word:
+			current = current.setdefault(letter, {})
+		current[None] = True
+	return root
+
+def measure(name, create, words, lookup):
+	tracemalloc.start()
+	container = create(words)
+	size, _ = tracemalloc.get_traced_memory()
+	tracemalloc.stop()
+	queries = words[::97]
+	elapsed = timeit.timeit(lambda: [lookup(container, q) for q in queries], number=10)
+	print('{0: <20}{1: >12.1f} KiB{2: >12.2f} us/lookup'.format(name, size / 1024.0, elapsed * 1e6 / (10 * len(queries))))
+	return container
+
+def trie_lookup(trie, word):
+	for letter in word:
+		trie = trie.get(letter)
+		if trie is None:
+			return False
+	return None in trie
+
+words = generate_words(int(sys.argv[1]) if len(sys.argv) > 1 else 130000)
+print('{0} words'.format(len(words)))
+measure('set', set, words, lambda c, w: w in c)
+measure('dict', lambda w: dict.fromkeys(w, True), words, lambda c, w: w in c)
+measure('dict-of-dicts trie', create_trie, words, trie_lookup)
+wordlist = measure('WordList', cmudict.WordList.create, words, lambda c, w: w in c)
+
+path = os.path.join(tempfile.mkdtemp(), 'words.idx')
+wordlist.save(path)
+measure('WordList (mmap)', lambda w: cmudict.WordList.load(path), words, lambda c, w: w in c)
+
+elapsed = timeit.timeit(lambda: list(wordlist.prefix('AB')), number=10)
+print('WordList prefix enumeration: {0:.2f} ms/query'.format(elapsed * 1e3 / 10))
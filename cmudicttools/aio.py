@@ -0,0 +1,71 @@
+#!/usr/bin/python
+# coding=utf-8
+#
+# Asynchronous (asyncio) interface to the CMU Pronunciation Dictionary parser.
+#
+# Copyright (C) 2017 Reece H. Dunn
+#
+# This file is part of cmudict-tools.
+#
+# cmudict-tools is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# cmudict-tools is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with cmudict-tools.  If not, see <http://www.gnu.org/licenses/>.
+
+import asyncio
+import itertools
+
+from . import cmudict
+
+class StreamReaderLines:
+	"""
+		Iterate over the lines of an asyncio.StreamReader from a worker thread.
+
+		Each line is read by scheduling the `readline` coroutine on the event
+		loop, so the event loop is not blocked while waiting for input.
+	"""
+
+	def __init__(self, reader, loop):
+		self.reader = reader
+		self.loop = loop
+
+	def __iter__(self):
+		while True:
+			line = asyncio.run_coroutine_threadsafe(self.reader.readline(), self.loop).result()
+			if not line:
+				return
+			yield line
+
+async def parse(filename, chunk_size=1000, executor=None, **kwargs):
+	"""
+		Parse the dictionary entries without blocking the event loop.
+
+		The `filename` can be anything accepted by `cmudict.parse`, or an
+		asyncio.StreamReader. The other keyword arguments are passed to
+		`cmudict.parse`.
+
+		The entries are read and validated in a worker thread, `chunk_size`
+		entries at a time, and yielded as (word, context, phonemes, comment,
+		metadata, error) tuples.
+	"""
+	if hasattr(asyncio, 'get_running_loop'): # Python 3.7 or later
+		loop = asyncio.get_running_loop()
+	else:
+		loop = asyncio.get_event_loop()
+	if isinstance(filename, asyncio.StreamReader):
+		filename = StreamReaderLines(filename, loop)
+	entries = cmudict.parse(filename, **kwargs)
+	while True:
+		chunk = await loop.run_in_executor(executor, list, itertools.islice(entries, chunk_size))
+		if not chunk:
+			return
+		for entry in chunk:
+			yield entry
@@ -25,8 +25,25 @@ from __future__ import print_function
 import os
 import sys
 import re
+import bz2
+import gzip
+import io
 import json
+import mmap
+import itertools
 import codecs
+import struct
+import array
+import time
+import hashlib
+import heapq
+import sqlite3
+import collections
+import linecache
+import multiprocessing
+import threading
+import shutil
+import tempfile
 
 from . import metadata
 
@@ -40,6 +57,92 @@ try:
 except ImportError:
 	unicode_sort_key = None
 
+try:
+	import lzma
+except ImportError:
+	try:
+		from backports import lzma
+	except ImportError:
+		lzma = None
+
+try:
+	import tracemalloc
+except ImportError:
+	tracemalloc = None
+
+class MemoryReportNotSupported(ValueError):
+	def __init__(self, message):
+		ValueError.__init__(self, message)
+
+class MemoryReport:
+	"""
+		Track the memory used by the dictionary processing stages using
+		tracemalloc.
+
+		The stages call `memory_checkpoint` when their buffers are at their
+		largest. The memory in use at each checkpoint is recorded, and a
+		snapshot is kept of the largest checkpoint to report the allocations
+		that make up that memory.
+	"""
+
+	def __init__(self, frames=1):
+		if not tracemalloc:
+			raise MemoryReportNotSupported('memory reports are not supported (Python 3.4 or later is needed)')
+		self.stages = collections.OrderedDict()
+		self.snapshot = None
+		self.snapshot_size = 0
+		tracemalloc.start(frames)
+
+	def checkpoint(self, stage):
+		size, _ = tracemalloc.get_traced_memory()
+		self.stages[stage] = max(size, self.stages.get(stage, 0))
+		if size > self.snapshot_size:
+			self.snapshot = tracemalloc.take_snapshot()
+			self.snapshot_size = size
+
+	def stop(self):
+		self.checkpoint('end')
+		_, self.peak = tracemalloc.get_traced_memory()
+		tracemalloc.stop()
+
+	def format(self, limit=10):
+		yield u'Peak memory: {0:.1f} KiB'.format(self.peak / 1024.0)
+		yield u'Stages:'
+		for stage, size in self.stages.items():
+			yield u'  {0: >12.1f} KiB  {1}'.format(size / 1024.0, stage)
+		if self.snapshot:
+			yield u'Top allocations:'
+			for stat in self.snapshot.statistics('lineno')[:limit]:
+				frame = stat.traceback[0]
+				location = u'{0}:{1}'.format(os.path.basename(frame.filename), frame.lineno)
+				source = linecache.getline(frame.filename, frame.lineno).strip()
+				yield u'  {0: >12.1f} KiB  {1}  {2}'.format(stat.size / 1024.0, location, source)
+
+memory_report = None
+
+def start_memory_report():
+	"""
+		Start the process-wide memory report used by `--memory-report`.
+
+		The report is a module global, as tracemalloc traces the whole process,
+		so it is only for single-threaded use like the command line tool. The
+		memory of dictionaries parsed on other threads at the same time is
+		included in the report.
+	"""
+	global memory_report
+	memory_report = MemoryReport()
+	return memory_report
+
+def stop_memory_report():
+	global memory_report
+	report, memory_report = memory_report, None
+	report.stop()
+	return report
+
+def memory_checkpoint(stage):
+	if memory_report:
+		memory_report.checkpoint(stage)
+
 def create_sort_key(mode):
 	if not mode or mode in ['weide', 'air']:
 		return default_sort_key
@@ -54,15 +157,30 @@ root = os.path.dirname(os.path.realpath(__file__))
 if sys.version_info[0] == 2:
 	ustr = unicode
 
-	def printf(fmt, encoding, *args):
+	def stdin():
+		return sys.stdin
+
+	def stdout():
+		return sys.stdout
+
+	def fprintf(f, fmt, encoding, *args):
 		output = unicode(fmt).format(*args)
-		sys.stdout.write(output.encode(encoding))
+		f.write(output.encode(encoding))
 else:
 	ustr = str
 
-	def printf(fmt, encoding, *args):
+	def stdin():
+		return sys.stdin.buffer
+
+	def stdout():
+		return sys.stdout.buffer
+
+	def fprintf(f, fmt, encoding, *args):
 		output = fmt.format(*args)
-		sys.stdout.buffer.write(output.encode(encoding))
+		f.write(output.encode(encoding))
+
+def printf(fmt, encoding, *args):
+	fprintf(stdout(), fmt, encoding, *args)
 
 def read_phonetable(filename):
 	columns = None
@@ -110,6 +228,8 @@ class StressType:
 		return ['0', '1', '2', 'W', 'S', 'C', 'P']
 
 class IpaPhonemeSet:
+	separator = ''
+
 	def __init__(self, accent):
 		self.to_ipa = {}
 		self.accent = accent
@@ -136,13 +256,19 @@ class IpaPhonemeSet:
 
 	def to_local_phonemes(self, phonemes):
 		for phoneme in phonemes:
-			if phoneme in self.to_ipa.keys():
+			phoneme = phoneme.upper() # lower case phonesets have lower case normalized phonemes
+			if phoneme in self.to_ipa:
 				yield self.to_ipa[phoneme]
 
+	def normalized_phonemes(self):
+		return set(self.to_ipa.keys())
+
 	def format(self, phonemes):
-		return ''.join(self.to_local_phonemes(phonemes))
+		return self.separator.join(self.to_local_phonemes(phonemes))
 
 class ArpabetPhonemeSet:
+	separator = ' '
+
 	def __init__(self, capitalization, name):
 		self.name = name
 		self.re_phonemes = re.compile(r' (?=[^ ])')
@@ -159,6 +285,7 @@ class ArpabetPhonemeSet:
 		self.missing_stress_marks = set()
 		self.stress_types = {}
 		self.phone_types = {}
+		self.unchanged = None
 
 	def add(self, data):
 		phoneme = self.conversion(data['Arpabet'])
@@ -231,21 +358,21 @@ class ArpabetPhonemeSet:
 			if ' ' in phoneme or '\t' in phoneme:
 				phoneme = phoneme.strip()
 				if is_check_enabled('phoneme-spacing', checks, meta):
-					yield None, 'Incorrect whitespace after phoneme "{0}"'.format(phoneme)
+					yield None, ParseError('phoneme-spacing', u'Incorrect whitespace after phoneme "{0}"', phoneme)
 
 			if phoneme in self.missing_stress_marks:
 				if is_check_enabled('missing-stress', checks, meta):
-					yield None, 'Vowel phoneme "{0}" missing stress marker'.format(phoneme)
+					yield None, ParseError('missing-stress', u'Vowel phoneme "{0}" missing stress marker', phoneme)
 			elif not phoneme in self.to_arpabet.keys():
 				newphoneme = self.conversion(phoneme)
 				if is_check_enabled('invalid-phonemes', checks, meta):
 					if newphoneme in self.missing_stress_marks:
 						if is_check_enabled('missing-stress', checks, meta):
-							yield None, 'Vowel phoneme "{0}" missing stress marker'.format(phoneme)
+							yield None, ParseError('missing-stress', u'Vowel phoneme "{0}" missing stress marker', phoneme)
 					elif not newphoneme in self.to_arpabet.keys():
-						yield None, 'Invalid phoneme "{0}"'.format(phoneme)
+						yield None, ParseError('invalid-phonemes', u'Invalid phoneme "{0}"', phoneme)
 					else:
-						yield None, 'Incorrect phoneme casing "{0}"'.format(phoneme)
+						yield None, ParseError('invalid-phonemes', u'Incorrect phoneme casing "{0}"', phoneme)
 				yield newphoneme, None
 				continue
 
@@ -254,13 +381,25 @@ class ArpabetPhonemeSet:
 	def to_local_phonemes(self, phonemes):
 		for phoneme in phonemes:
 			phoneme = self.conversion(phoneme)
-			if phoneme in self.from_arpabet.keys():
+			if phoneme in self.from_arpabet:
 				yield self.from_arpabet[phoneme]
 			else:
 				yield phoneme
 
+	def normalized_phonemes(self):
+		return set(self.to_arpabet.values())
+
+	def unchanged_phonemes(self):
+		"""
+			The normalized phonemes that are formatted as themselves.
+		"""
+		if self.unchanged is None:
+			phonemes = set(self.to_arpabet.values())
+			self.unchanged = frozenset([p for p, local in zip(phonemes, self.to_local_phonemes(phonemes)) if p == local])
+		return self.unchanged
+
 	def format(self, phonemes):
-		return ' '.join(self.to_local_phonemes(phonemes))
+		return self.separator.join(self.to_local_phonemes(phonemes))
 
 phonesets = {
 	'arpabet':  lambda: ArpabetPhonemeSet('upper', 'arpabet'),
@@ -271,15 +410,139 @@ phonesets = {
 	'timit':    lambda: ArpabetPhonemeSet('lower', 'timit'),
 }
 
+loaded_phonemes = {}
+loaded_lock = threading.RLock()
+
 def load_phonemes(accent, phoneset):
-	phones = phonesets[phoneset]()
+	"""
+		Load the `phoneset` phonemes for `accent`. The phoneme sets are cached,
+		so the accent file is only read once for each phoneset.
+	"""
 	if not accent.endswith('.csv'):
 		accent = os.path.join(root, 'accents', '{0}.csv'.format(accent))
-	for p in read_phonetable(accent):
-		if phoneset in p['Phone Sets']:
-			phones.add(p)
+	phones = loaded_phonemes.get((accent, phoneset))
+	if phones:
+		return phones
+	with loaded_lock:
+		phones = loaded_phonemes.get((accent, phoneset))
+		if phones:
+			return phones
+		phones = phonesets[phoneset]()
+		for p in read_phonetable(accent):
+			if phoneset in p['Phone Sets']:
+				phones.add(p)
+		loaded_phonemes[(accent, phoneset)] = phones
 	return phones
 
+class PhonemeConverter:
+	"""
+		Convert phonemes from the `source` phoneset to the `target` phoneset
+		using a single table lookup per phoneme.
+
+		If `source` is None, the phonemes are the normalized arpabet phonemes
+		returned by `parse`. The table is built from the normalized phonemes of
+		the target phoneset, in upper and lower case as the case depends on
+		the phoneset the dictionary was parsed from. Any other phonemes are
+		added to the table as they are used.
+
+		The `transliterate` method converts many pronunciations at once,
+		caching up to `cache_size` converted pronunciations.
+	"""
+
+	def __init__(self, accent, source, target, cache_size=1000000):
+		self.target = load_phonemes(accent, target)
+		self.separator = self.target.separator
+		self.table = {}
+		self.pronunciations = {}
+		self.cache_size = cache_size
+		if source:
+			for phoneme, normalized in load_phonemes(accent, source).to_arpabet.items():
+				self.table[phoneme] = self.target.format([normalized])
+		else:
+			for normalized in self.target.normalized_phonemes():
+				for phoneme in [normalized.upper(), normalized.lower()]:
+					self.table[phoneme] = self.target.format([phoneme])
+
+	def convert(self, phoneme):
+		try:
+			return self.table[phoneme]
+		except KeyError:
+			local = self.table[phoneme] = self.target.format([phoneme])
+			return local
+
+	def format(self, phonemes):
+		table = self.table
+		try:
+			return self.separator.join([table[p] for p in phonemes])
+		except KeyError:
+			return self.separator.join([self.convert(p) for p in phonemes])
+
+	def transliterations(self, pronunciations):
+		cache = self.pronunciations
+		for phonemes in pronunciations:
+			if isinstance(phonemes, list):
+				phonemes = tuple(phonemes)
+			try:
+				yield cache[phonemes]
+			except KeyError:
+				if len(cache) >= self.cache_size:
+					cache.clear()
+				if isinstance(phonemes, tuple):
+					local = cache[phonemes] = self.format(phonemes)
+				else:
+					local = cache[phonemes] = self.format(phonemes.split())
+				yield local
+
+	def transliterate(self, pronunciations, result='list'):
+		"""
+			Convert the pronunciations, given as lists or tuples of phonemes or
+			as space-separated strings. The `result` is one of:
+				list      -- a list of the converted pronunciations;
+				generator -- a generator of the converted pronunciations;
+				columnar  -- a (text, offsets) pair, where `text` contains the
+				             converted pronunciations and `offsets` is an array
+				             such that the i-th pronunciation is the text from
+				             offsets[i] to offsets[i+1].
+		"""
+		if result == 'list':
+			return list(self.transliterations(pronunciations))
+		if result == 'generator':
+			return self.transliterations(pronunciations)
+		if result == 'columnar':
+			offsets = array.array('L', [0])
+			values = []
+			position = 0
+			for local in self.transliterations(pronunciations):
+				values.append(local)
+				position = position + len(local)
+				offsets.append(position)
+			return u''.join(values), offsets
+		raise ValueError('Unsupported transliteration result: {0}'.format(result))
+
+loaded_converters = {}
+
+def load_converter(accent, source, target):
+	"""
+		Load the phoneme converter for `accent` from the `source` phoneset (or
+		the normalized arpabet phonemes if None) to the `target` phoneset.
+	"""
+	converter = loaded_converters.get((accent, source, target))
+	if converter:
+		return converter
+	with loaded_lock:
+		converter = loaded_converters.get((accent, source, target))
+		if not converter:
+			converter = PhonemeConverter(accent, source, target)
+			loaded_converters[(accent, source, target)] = converter
+	return converter
+
+def transliterate(pronunciations, phoneset='ipa', accent='en-US', source=None, result='list'):
+	"""
+		Convert the pronunciations to `phoneset` in a single call. See
+		`PhonemeConverter.transliterate` for details.
+	"""
+	return load_converter(accent, source, phoneset).transliterate(pronunciations, result)
+
 dict_formats = { # {0} = word ; {1} = context ; {2} = phonemes ; {3} = comment
 	'cmudict-weide': {
 		'accent': 'en-US',
@@ -377,38 +640,311 @@ default_warnings = [
 	'word-casing'
 ]
 
-# dict() is too slow for indexing cmudict entries, so use a simple trie
-# data structure instead ...
-class Trie:
-	def __init__(self):
-		self.root = {}
+class ParseError:
+	"""
+		An error found when parsing or validating the dictionary.
 
-	def lookup(self, key):
-		current = self.root
-		for letter in key:
-			if letter in current:
-				current = current[letter]
+		The `check` is the validation check (see `parser_warnings`) or type of
+		error, and `line_number` is the line in the dictionary the error is
+		for. The message is only formatted from the `args` when the error is
+		printed.
+	"""
+
+	__slots__ = ['check', 'message', 'args', 'line_number']
+
+	def __init__(self, check, message, *args):
+		self.check = check
+		self.message = message
+		self.args = args
+		self.line_number = None
+
+	def format(self):
+		return self.message.format(*self.args)
+
+	if sys.version_info[0] == 2:
+		def __unicode__(self):
+			return self.format()
+
+		def __str__(self):
+			return self.format().encode('utf-8')
+	else:
+		def __str__(self):
+			return self.format()
+
+	def __repr__(self):
+		return 'ParseError({0!r}, {1!r})'.format(self.check, self.format())
+
+class TooManyErrors(Exception):
+	def __init__(self, max_errors):
+		Exception.__init__(self, 'stopped after {0} errors'.format(max_errors))
+
+def filter_errors(entries, max_errors=None, counts=None):
+	"""
+		Stop reading the entries after `max_errors` errors, if specified, by
+		raising TooManyErrors after the last error is returned. This is an
+		exception so the truncated entries are not taken as the whole
+		dictionary.
+
+		If `counts` is a dictionary, the errors are counted there for each
+		check instead of being returned.
+	"""
+	errors = 0
+	for entry in entries:
+		error = entry[5]
+		if error:
+			errors = errors + 1
+			if counts is None:
+				yield entry
+			else:
+				check = getattr(error, 'check', None) or 'error'
+				counts[check] = counts.get(check, 0) + 1
+			if max_errors and errors >= max_errors:
+				raise TooManyErrors(max_errors)
+		else:
+			yield entry
+
+class WordList:
+	"""
+		A sorted, array-backed list of words that supports lookup and prefix
+		enumeration.
+
+		The words are stored in a single utf-8 encoded buffer with a table of
+		word offsets, using the following layout:
+
+			magic (8 bytes) ; count (uint32) ; offsets (count+1 uint32) ; words
+
+		This is the same as the serialized form, so a saved word list can be
+		memory mapped and searched without loading it.
+	"""
+
+	magic = b'CMUWORDS'
+
+	def __init__(self, data, offset=0):
+		if data[offset:offset + 8] != self.magic:
+			raise ValueError('Invalid word list data')
+		self.data = data
+		self.offset = offset
+		self.count = struct.unpack_from('<I', data, offset + 8)[0]
+		self.base = offset + 12 + 4 * (self.count + 1)
+		self.size = self.base - offset + struct.unpack_from('<I', data, offset + 12 + 4 * self.count)[0]
+
+	@staticmethod
+	def create(words):
+		words = sorted(set([word.encode('utf-8') for word in words]))
+		offsets = [0]
+		for word in words:
+			offsets.append(offsets[-1] + len(word))
+		header = struct.pack('<I{0}I'.format(len(offsets)), len(words), *offsets)
+		return WordList(WordList.magic + header + b''.join(words))
+
+	@staticmethod
+	def load(filename):
+		with open(filename, 'rb') as f:
+			return WordList(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+	def save(self, filename):
+		with open(filename, 'wb') as f:
+			f.write(self.data[self.offset:self.offset + self.size])
+
+	def key(self, index):
+		start, end = struct.unpack_from('<II', self.data, self.offset + 12 + 4 * index)
+		return self.data[self.base + start:self.base + end]
+
+	def bisect(self, key):
+		lo, hi = 0, self.count
+		while lo < hi:
+			mid = (lo + hi) // 2
+			if self.key(mid) < key:
+				lo = mid + 1
 			else:
-				return False, None
-		if None in current:
-			return True, current[None]
-		return False, None
-
-	def __contains__(self, key):
-		valid, _ = self.lookup(key)
-		return valid
-
-	def __getitem__(self, key):
-		valid, item = self.lookup(key)
-		if not valid:
-			raise KeyError('Item not in Trie')
-		return item
-
-	def __setitem__(self, key, value):
-		current = self.root
-		for letter in key:
-			current = current.setdefault(letter, {})
-		current[None] = value
+				hi = mid
+		return lo
+
+	def __len__(self):
+		return self.count
+
+	def __getitem__(self, index):
+		if index < 0 or index >= self.count:
+			raise IndexError('WordList index out of range')
+		return self.key(index).decode('utf-8')
+
+	def __iter__(self):
+		for index in range(self.count):
+			yield self.key(index).decode('utf-8')
+
+	def __contains__(self, word):
+		key = word.encode('utf-8')
+		index = self.bisect(key)
+		return index < self.count and self.key(index) == key
+
+	def prefix(self, prefix):
+		key = prefix.encode('utf-8')
+		for index in range(self.bisect(key), self.count):
+			word = self.key(index)
+			if not word.startswith(key):
+				break
+			yield word.decode('utf-8')
+
+class LineIndex:
+	"""
+		An index of the byte offsets of the lines for each word in a
+		dictionary file, using the following layout:
+
+			magic (8 bytes) ; mtime (double) ; size (uint64) ;
+			header size (uint64) ; word list size (uint64) ; word list ;
+			line table (count+1 uint32) ; line offsets (uint64)
+
+		The words are stored in upper case in a `WordList`, and the line table
+		gives the range of line offsets for the word at each position in the
+		word list. The header size is the offset of the first entry in the
+		dictionary. The mtime and size of the dictionary file are used to
+		check if the index is out of date.
+	"""
+
+	magic = b'CMULINES'
+
+	def __init__(self, data):
+		if data[0:8] != self.magic:
+			raise ValueError('Invalid line index data')
+		self.data = data
+		self.mtime, self.size, self.header_size, words_size = struct.unpack_from('<dQQQ', data, 8)
+		self.words = WordList(data, 40)
+		self.table = 40 + words_size
+		self.positions = self.table + 4 * (self.words.count + 1)
+
+	@staticmethod
+	def create(filename, encoding='windows-1252'):
+		dict_parser, _ = setup_dict_parser(filename)
+		offsets = {}
+		current = [0, 0]
+		header_size = None
+
+		def lines():
+			with open(filename, 'rb') as f:
+				for line in f:
+					current[0] = current[1]
+					current[1] = current[1] + len(line)
+					yield line.rstrip(b'\r\n')
+
+		parser_context = ParserContext(filename, [], encoding)
+		for line, format, word, context, phonemes, comment, meta, error in dict_parser(lines(), [], encoding, parser_context):
+			if word:
+				if header_size is None:
+					header_size = current[0]
+				offsets.setdefault(word.upper(), []).append(current[0])
+		if header_size is None:
+			header_size = current[1]
+
+		words = WordList.create(offsets.keys())
+		table = [0]
+		positions = []
+		for word in words:
+			positions.extend(offsets[word])
+			table.append(len(positions))
+		stat = os.stat(filename)
+		header = struct.pack('<dQQQ', stat.st_mtime, stat.st_size, header_size, words.size)
+		return LineIndex(b''.join([
+			LineIndex.magic,
+			header,
+			words.data,
+			struct.pack('<{0}I'.format(len(table)), *table),
+			struct.pack('<{0}Q'.format(len(positions)), *positions)]))
+
+	@staticmethod
+	def load(filename):
+		with open(filename, 'rb') as f:
+			return LineIndex(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+	@staticmethod
+	def open(filename, index_filename=None, encoding='windows-1252'):
+		"""
+			Load the index from `index_filename`, creating and saving it if
+			it is missing or out of date. If `index_filename` is None, the
+			index is created in memory.
+		"""
+		if index_filename and os.path.exists(index_filename):
+			index = LineIndex.load(index_filename)
+			if index.is_valid(filename):
+				return index
+		index = LineIndex.create(filename, encoding)
+		if index_filename:
+			index.save(index_filename)
+		return index
+
+	def save(self, filename):
+		with open(filename, 'wb') as f:
+			f.write(self.data[:])
+
+	def is_valid(self, filename):
+		stat = os.stat(filename)
+		return stat.st_mtime == self.mtime and stat.st_size == self.size
+
+	def lookup(self, word):
+		key = word.upper().encode('utf-8')
+		index = self.words.bisect(key)
+		if index >= self.words.count or self.words.key(index) != key:
+			return []
+		start, end = struct.unpack_from('<II', self.data, self.table + 4 * index)
+		return list(struct.unpack_from('<{0}Q'.format(end - start), self.data, self.positions + 8 * start))
+
+class Dictionary:
+	"""
+		A random access view of the entries in a dictionary file.
+
+		The lines for each word are located using a `LineIndex`, and are
+		parsed and validated with `parse` when they are looked up. The
+		dictionary file is memory mapped, so only the lines that are looked
+		up (and the comments before the first entry, which can contain
+		file-based metadata) are read.
+
+		The keyword arguments are passed to `parse`.
+	"""
+
+	def __init__(self, filename, index_filename=None, **kwargs):
+		self.filename = filename
+		self.options = kwargs
+		self.index = LineIndex.open(filename, index_filename, kwargs.get('encoding', 'windows-1252'))
+		with open(filename, 'rb') as f:
+			self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+		self.header = self.data[0:self.index.header_size]
+		self.header_entries = len(list(self.parse(self.header)))
+
+	def parse(self, data):
+		lines = io.BytesIO(data)
+		lines.name = self.filename
+		return parse(lines, **self.options)
+
+	def line(self, offset):
+		end = self.data.find(b'\n', offset)
+		if end == -1:
+			end = len(self.data)
+		return self.data[offset:end].rstrip(b'\r')
+
+	def lines(self, word):
+		return [self.line(offset) for offset in self.index.lookup(word)]
+
+	def __contains__(self, word):
+		return len(self.index.lookup(word)) > 0
+
+	def __getitem__(self, word):
+		lines = self.lines(word)
+		if not lines:
+			raise KeyError(word)
+		entries = self.parse(self.header + b'\n'.join(lines) + b'\n')
+		return list(itertools.islice(entries, self.header_entries, None))
+
+	def get(self, word, default=None):
+		try:
+			return self[word]
+		except KeyError:
+			return default
+
+def sort_keyword(word, context, mode):
+	if not context:
+		return word
+	if mode == 'weide':
+		return '{0}({1})'.format(word, context)
+	return '{0}!{1}'.format(word, context)
 
 def sort(entries, mode):
 	if mode is None:
@@ -420,17 +956,9 @@ def sort(entries, mode):
 			if not word:
 				yield (word, context, phonemes, comment, metadata, error)
 				continue
-			if mode == 'weide':
-				if context:
-					keyword = '{0}({1})'.format(word, context)
-				else:
-					keyword = word
-			elif mode in ['air', 'unicode']:
-				if context:
-					keyword = '{0}!{1}'.format(word, context)
-				else:
-					keyword = word
+			keyword = sort_keyword(word, context, mode)
 			ordered.append((keyword, (word, context, phonemes, comment, metadata, error)))
+		memory_checkpoint('sort')
 		sort_key = create_sort_key(mode)
 		def sorting(x):
 			return sort_key(x[0])
@@ -483,7 +1011,7 @@ def remove_context_entries(entries):
 			yield word, context, phonemes, comment, metadata, error
 
 def remove_stress(entries, order_from=0):
-	words = Trie()
+	words = {}
 	for word, context, phonemes, comment, metadata, error in entries:
 		if not word:
 			yield word, context, phonemes, comment, metadata, error
@@ -501,20 +1029,390 @@ def remove_stress(entries, order_from=0):
 		words[word] = (context + 1, pronunciations)
 		yield word, context, phonemes, comment, metadata, error
 
-def format_text(dict_format, entries, accent=None, phoneset=None, encoding='windows-1252', input_encoding='windows-1252', output_context=None, rootdir=None):
-	fmt = dict_formats[dict_format]
-	if not accent:
-		accent = fmt['accent']
-	if not phoneset:
-		phoneset = fmt['phoneset']
-	if phoneset == 'ipa':
-		encoding = 'utf-8'
-	phonemeset = load_phonemes(accent, phoneset)
-	metaformatter = None
-	for word, context, phonemes, comment, meta, error in entries:
-		if error:
-			print(error, file=sys.stderr)
+class PronunciationIndex:
+	"""
+		Reverse index of the pronunciations in a dictionary.
+
+		The entries are the parsed (word, context, phonemes, comment, metadata,
+		error) tuples returned from `parse`. Words are indexed by their
+		normalized pronunciation and rhyme key (the phonemes from the last
+		primary stressed vowel onward), so the homophone and rhyme queries
+		are dictionary lookups.
+	"""
+
+	def __init__(self, entries=[], accent=None):
+		self.phonemeset = load_phonemes(accent or 'en-US', 'arpabet')
+		self.pronunciations = {}
+		self.words_by_pronunciation = {}
+		self.words_by_rhyme = {}
+		for word, context, phonemes, comment, metadata, error in entries:
+			if word and not error:
+				self.add(word, phonemes)
+
+	def normalize(self, phonemes):
+		return [p.upper() for p in phonemes if not 'syllable' in self.phonemeset.types(p.upper())]
+
+	def rhyme_key(self, phonemes):
+		phonemes = self.normalize(phonemes)
+		stress_types = [self.phonemeset.stress_type(p) for p in phonemes]
+		for stress in [StressType.PRIMARY_STRESS, StressType.SECONDARY_STRESS, StressType.UNSTRESSED, StressType.WEAK, StressType.SYLLABIC]:
+			if stress in stress_types:
+				start = len(stress_types) - stress_types[::-1].index(stress) - 1
+				return ' '.join(phonemes[start:])
+		return ' '.join(phonemes)
+
+	def add(self, word, phonemes):
+		keyword = word.upper()
+		pronunciation = ' '.join(self.normalize(phonemes))
+		rhyme = self.rhyme_key(phonemes)
+		self.pronunciations.setdefault(keyword, []).append((pronunciation, rhyme))
+		for index, key in [(self.words_by_pronunciation, pronunciation), (self.words_by_rhyme, rhyme)]:
+			index.setdefault(key, collections.OrderedDict())[word] = None # an ordered set
+
+	def _lookup(self, word, index, field):
+		keyword = word.upper()
+		ret = collections.OrderedDict()
+		for key in self.pronunciations.get(keyword, []):
+			for match in index[key[field]]:
+				if match.upper() != keyword:
+					ret[match] = None
+		return list(ret.keys())
+
+	def homophones(self, word):
+		return self._lookup(word, self.words_by_pronunciation, 0)
+
+	def rhymes(self, word):
+		return self._lookup(word, self.words_by_rhyme, 1)
+
+def compile_phoneme_pattern(pattern):
+	"""
+		Compile a phoneme pattern to a regular expression on the pronunciation
+		and the runs of literal phonemes used to narrow down the matches.
+
+		A pattern of the form `/REGEX/` is matched anywhere in the space
+		separated pronunciation. Otherwise, the pattern is a space separated
+		list of phonemes matching the whole pronunciation, where `*` matches
+		zero or more phonemes, `?` matches a single phoneme, and `*` and `?`
+		within a phoneme match any characters (e.g. `*1` matches any vowel
+		with primary stress).
+	"""
+	if len(pattern) > 1 and pattern.startswith('/') and pattern.endswith('/'):
+		return re.compile(pattern[1:-1], re.IGNORECASE), []
+	expression = []
+	runs = []
+	run = [PhonemeIndex.boundary]
+	for token in pattern.upper().split():
+		if token == '*':
+			expression.append(r'(?: [^ ]+)*')
+		elif token == '?':
+			expression.append(r' [^ ]+')
+		elif '*' in token or '?' in token:
+			expression.append(' ' + re.escape(token).replace(r'\*', '[^ ]*').replace(r'\?', '[^ ]'))
+		else:
+			expression.append(' ' + re.escape(token))
+			run.append(token)
 			continue
+		if len([p for p in run if p != PhonemeIndex.boundary]) > 0:
+			runs.append(run)
+		run = []
+	run.append(PhonemeIndex.boundary)
+	if len([p for p in run if p != PhonemeIndex.boundary]) > 0:
+		runs.append(run)
+	return re.compile('^{0} $'.format(''.join(expression))), runs
+
+class PhonemeIndex:
+	"""
+		A phoneme trigram index of the dictionary pronunciations.
+
+		The entries are the parsed (word, context, phonemes, comment, metadata,
+		error) tuples returned from `parse`. Each pronunciation is indexed by
+		the phoneme trigrams it contains, including a `#` boundary marker at
+		the start and end of the pronunciation. This is used to find the
+		candidate entries for a pattern before matching them against the
+		pattern's regular expression.
+	"""
+
+	boundary = '#'
+
+	def __init__(self, entries=[]):
+		self.entries = []
+		self.trigrams = {}
+		for word, context, phonemes, comment, metadata, error in entries:
+			if word and not error:
+				self.add(word, context, phonemes)
+
+	def add(self, word, context, phonemes):
+		index = len(self.entries)
+		self.entries.append((word, context, phonemes))
+		padded = [self.boundary] + [p.upper() for p in phonemes] + [self.boundary]
+		for i in range(len(padded) - 2):
+			postings = self.trigrams.setdefault(' '.join(padded[i:i+3]), [])
+			if not postings or postings[-1] != index:
+				postings.append(index)
+
+	@staticmethod
+	def load(filename):
+		with open(filename, 'r') as f:
+			data = json.load(f)
+		index = PhonemeIndex()
+		index.entries = [tuple(entry) for entry in data['entries']]
+		index.trigrams = data['trigrams']
+		return index
+
+	def save(self, filename):
+		with open(filename, 'w') as f:
+			json.dump({'entries': self.entries, 'trigrams': self.trigrams}, f)
+
+	def candidates(self, run):
+		if len(run) >= 3:
+			ret = None
+			for i in range(len(run) - 2):
+				postings = set(self.trigrams.get(' '.join(run[i:i+3]), []))
+				ret = postings if ret is None else ret & postings
+			return ret
+		ret = set()
+		for trigram, postings in self.trigrams.items():
+			phonemes = trigram.split(' ')
+			if phonemes[0:len(run)] == run or phonemes[1:len(run)+1] == run or phonemes[3-len(run):] == run:
+				ret.update(postings)
+		return ret
+
+	def search(self, pattern):
+		expression, runs = compile_phoneme_pattern(pattern)
+		candidates = None
+		for run in runs:
+			postings = self.candidates(run)
+			candidates = postings if candidates is None else candidates & postings
+		if candidates is None:
+			candidates = range(len(self.entries))
+		for index in sorted(candidates):
+			word, context, phonemes = self.entries[index]
+			pronunciation = u' {0} '.format(' '.join(phonemes).upper())
+			if expression.search(pronunciation):
+				yield word, context, phonemes
+
+class InvalidSelector(ValueError):
+	def __init__(self, message):
+		ValueError.__init__(self, message)
+
+selector_fields = {
+	'word':     lambda word, context, phonemes, comment, meta: word,
+	'context':  lambda word, context, phonemes, comment, meta: context,
+	'phonemes': lambda word, context, phonemes, comment, meta: ' '.join(phonemes) if phonemes else None,
+	'count':    lambda word, context, phonemes, comment, meta: len(phonemes) if phonemes else None,
+	'stress':   lambda word, context, phonemes, comment, meta: ''.join([p[-1] for p in phonemes if p[-1] in '012']) if phonemes else None,
+	'comment':  lambda word, context, phonemes, comment, meta: comment,
+}
+
+selector_numeric_fields = ['count']
+
+selector_operators = {
+	'=':  lambda a, b: a == b,
+	'!=': lambda a, b: a != b,
+	'<':  lambda a, b: a < b,
+	'<=': lambda a, b: a <= b,
+	'>':  lambda a, b: a > b,
+	'>=': lambda a, b: a >= b,
+	'~':  lambda a, b: b.search(ustr(a)) is not None,
+}
+
+re_selector_token = re.compile(r'''\s*(?:"([^"]*)"|'([^']*)'|(!=|<=|>=|=|<|>|~|,|\||\(|\))|([^\s,|()=!<>~"']+))''')
+
+def tokenize_selector(expression):
+	pos = 0
+	expression = expression.strip()
+	while pos < len(expression):
+		m = re_selector_token.match(expression, pos)
+		if not m:
+			raise InvalidSelector(u'unknown select expression: `{0}`'.format(expression))
+		pos = m.end()
+		if m.group(3):
+			yield 'op', m.group(3)
+		elif m.group(4):
+			yield 'name', m.group(4)
+		else:
+			yield 'string', m.group(1) if m.group(1) is not None else m.group(2)
+
+class SelectorCompiler:
+	"""
+		Compile a select expression into a function on the parsed entries.
+
+		The expression has the form `FIELDS [where CONDITION]`, where `FIELDS`
+		is a comma-separated list of fields to select. A field can be one of
+		the `selector_fields`, `@KEY` for a metadata value, or `A|B` to select
+		`A` if present, or `B` if not.
+
+		The `CONDITION` compares fields to values using the
+		`selector_operators`, combined with `and`, `or`, `not` and brackets.
+		A field on its own checks that the field is present.
+	"""
+
+	def __init__(self, expression):
+		self.expression = expression
+		self.tokens = list(tokenize_selector(expression))
+		self.pos = 0
+
+	def error(self):
+		return InvalidSelector(u'unknown select expression: `{0}`'.format(self.expression))
+
+	def peek(self):
+		if self.pos < len(self.tokens):
+			return self.tokens[self.pos]
+		return None, None
+
+	def consume(self):
+		token = self.peek()
+		if token[0] is None:
+			raise self.error()
+		self.pos = self.pos + 1
+		return token
+
+	def accept(self, kind, value):
+		if self.peek() == (kind, value):
+			self.pos = self.pos + 1
+			return True
+		return False
+
+	def compile(self):
+		fields = [self.field(values=False)]
+		while self.accept('op', ','):
+			fields.append(self.field(values=False))
+		if self.accept('name', 'where'):
+			condition = self.condition()
+		else:
+			condition = lambda word, context, phonemes, comment, meta: True
+		if self.peek()[0] is not None:
+			raise self.error()
+
+		def selector(word, context, phonemes, comment, meta, error):
+			if not condition(word, context, phonemes, comment, meta):
+				return None
+			ret = [field(word, context, phonemes, comment, meta) for field in fields]
+			if all([value is None for value in ret]):
+				return None
+			return ret
+		return selector
+
+	def field(self, values):
+		choices = [self.simple_field(values)]
+		while self.accept('op', '|'):
+			choices.append(self.simple_field(values))
+		if len(choices) == 1:
+			return choices[0]
+
+		def choice(word, context, phonemes, comment, meta):
+			for field in choices:
+				ret = field(word, context, phonemes, comment, meta)
+				if ret:
+					return ret
+			return [] if values else None
+		return choice
+
+	def simple_field(self, values):
+		kind, name = self.consume()
+		if kind != 'name':
+			raise self.error()
+		if name.startswith('@'):
+			key = name[1:]
+			if values:
+				return lambda word, context, phonemes, comment, meta: meta.get(key, []) if meta else []
+			return lambda word, context, phonemes, comment, meta: meta[key][0] if meta and key in meta else None
+		if not name in selector_fields:
+			raise self.error()
+		field = selector_fields[name]
+		if values:
+			def field_values(word, context, phonemes, comment, meta):
+				value = field(word, context, phonemes, comment, meta)
+				return [] if value is None or value == '' else [value]
+			return field_values
+		return field
+
+	def condition(self):
+		terms = [self.term()]
+		while self.accept('name', 'or'):
+			terms.append(self.term())
+		if len(terms) == 1:
+			return terms[0]
+		return lambda *entry: any([term(*entry) for term in terms])
+
+	def term(self):
+		factors = [self.factor()]
+		while self.accept('name', 'and'):
+			factors.append(self.factor())
+		if len(factors) == 1:
+			return factors[0]
+		return lambda *entry: all([factor(*entry) for factor in factors])
+
+	def factor(self):
+		if self.accept('name', 'not'):
+			factor = self.factor()
+			return lambda *entry: not factor(*entry)
+		if self.accept('op', '('):
+			condition = self.condition()
+			if not self.accept('op', ')'):
+				raise self.error()
+			return condition
+		start = self.pos
+		field = self.field(values=True)
+		names = [name for kind, name in self.tokens[start:self.pos] if kind == 'name']
+		kind, op = self.peek()
+		if kind != 'op' or not op in selector_operators:
+			return lambda *entry: len(field(*entry)) > 0
+		self.consume()
+		kind, value = self.consume()
+		if kind == 'op':
+			raise self.error()
+		compare = selector_operators[op]
+		if op == '~':
+			try:
+				value = re.compile(value)
+			except re.error:
+				raise InvalidSelector(u'invalid regular expression `{0}` in select expression: `{1}`'.format(value, self.expression))
+		else:
+			try:
+				value = int(value)
+			except ValueError:
+				if op in ['<', '<=', '>', '>='] and any([name in selector_numeric_fields for name in names]):
+					raise InvalidSelector(u'expected a number, not `{0}`, in select expression: `{1}`'.format(value, self.expression))
+
+		def matches(*entry):
+			for item in field(*entry):
+				target = value
+				if isinstance(value, int):
+					try:
+						item = int(item)
+					except ValueError:
+						item, target = ustr(item), ustr(value)
+				if compare(item, target):
+					return True
+			return False
+		return matches
+
+def compile_selector(expression):
+	return SelectorCompiler(expression).compile()
+
+class TextFormatter:
+	def __init__(self, dict_format, accent=None, phoneset=None, encoding='windows-1252', input_encoding='windows-1252', output=None, error_output=sys.stderr):
+		self.fmt = dict_formats[dict_format]
+		if not accent:
+			accent = self.fmt['accent']
+		if not phoneset:
+			phoneset = self.fmt['phoneset']
+		if phoneset == 'ipa':
+			encoding = 'utf-8'
+		self.converter = load_converter(accent, None, phoneset)
+		self.metaformatter = None
+		self.encoding = encoding
+		self.input_encoding = input_encoding
+		self.output = output or stdout()
+		self.error_output = error_output
+
+	def write(self, word, context, phonemes, comment, meta, error):
+		fmt = self.fmt
+		if error:
+			if self.error_output:
+				print(error, file=self.error_output)
+			return
 		components = []
 		if word:
 			components.append('entry')
@@ -523,14 +1421,14 @@ def format_text(dict_format, entries, accent=None, phoneset=None, encoding='wind
 			components.append('context')
 		if comment != None or meta != None:
 			if meta != None:
-				if word and metaformatter:
-					metastring = metaformatter(meta)
+				if word and self.metaformatter:
+					metastring = self.metaformatter(meta)
 				else:
 					metastring = metadata.format_key_values(meta)
-					if not encoding and 'encoding' in meta.keys():
-						encoding = meta['encoding'][0]
+					if not self.encoding and 'encoding' in meta.keys():
+						self.encoding = meta['encoding'][0]
 					if 'metadata-format' in meta.keys():
-						_, metaformatter = metadata.dict_formats[ meta['metadata-format'][0] ]
+						_, self.metaformatter = metadata.dict_formats[ meta['metadata-format'][0] ]
 				if comment:
 					comment = u'@@ {0} @@{1}'.format(metastring, comment)
 				else:
@@ -538,22 +1436,27 @@ def format_text(dict_format, entries, accent=None, phoneset=None, encoding='wind
 			if fmt['have-comments']:
 				components.append('comment')
 			elif not word: # line comment
-				continue
+				return
 		if phonemes:
-			phonemes = phonemeset.format(phonemes)
+			phonemes = self.converter.format(phonemes)
 		if len(components) == 0:
-			print()
-		elif encoding:
-			printf(fmt['-'.join(components)], encoding, word, context, phonemes, comment)
+			fprintf(self.output, '\n', 'ascii')
+		elif self.encoding:
+			fprintf(self.output, fmt['-'.join(components)], self.encoding, word, context, phonemes, comment)
 		else:
-			printf(fmt['-'.join(components)], input_encoding, word, context, phonemes, comment)
-
-def format_json(dict_format, entries, accent=None, phoneset=None, encoding='windows-1252', input_encoding='windows-1252'):
-	need_comma = False
-	if not encoding:
-		encoding = input_encoding
-	printf('[\n', encoding)
-	for word, context, pronunciation, comment, metadata, error in entries:
+			fprintf(self.output, fmt['-'.join(components)], self.input_encoding, word, context, phonemes, comment)
+
+	def close(self):
+		pass
+
+class JsonFormatter:
+	def __init__(self, dict_format, accent=None, phoneset=None, encoding='windows-1252', input_encoding='windows-1252', output=None, error_output=sys.stderr):
+		self.need_comma = False
+		self.encoding = encoding or input_encoding
+		self.output = output or stdout()
+		fprintf(self.output, '[\n', self.encoding)
+
+	def write(self, word, context, pronunciation, comment, metadata, error):
 		data = {}
 		if word:
 			data['word'] = word
@@ -566,35 +1469,554 @@ def format_json(dict_format, entries, accent=None, phoneset=None, encoding='wind
 		if metadata:
 			data['metadata'] = metadata
 		if error:
-			data['error-message'] = error
-		if need_comma:
-			printf(',\n', encoding)
-		printf('{0}', encoding, json.dumps(data, sort_keys=True))
-		need_comma = True
-	if need_comma:
-		printf('\n]\n', encoding)
-	else:
-		printf(']\n', encoding)
+			data['error-message'] = ustr(error)
+		if self.need_comma:
+			fprintf(self.output, ',\n', self.encoding)
+		fprintf(self.output, '{0}', self.encoding, json.dumps(data, sort_keys=True))
+		self.need_comma = True
+
+	def close(self):
+		if self.need_comma:
+			fprintf(self.output, '\n]\n', self.encoding)
+		else:
+			fprintf(self.output, ']\n', self.encoding)
+
+# The sonority of the phoneme types, from the least to the most sonorous.
+phoneme_sonority = {
+	'stop': 0,
+	'affricate': 1,
+	'fricative': 1,
+	'aspirate': 1,
+	'nasal': 2,
+	'liquid': 3,
+	'semivowel': 4,
+	'vowel': 5,
+	'schwa': 5,
+	'syllabic': 5,
+}
+
+def syllabify(phonemes, phonemeset):
+	"""
+		Split the normalized phonemes into syllables, returning a list of
+		(phonemes, stress) pairs, where `stress` is 1 for stressed syllables
+		and 0 otherwise.
 
-def format(dict_format, entries, accent=None, phoneset=None, encoding='windows-1252', input_encoding='windows-1252',  output_context=None, rootdir=None):
+		Each syllable has a vowel (or syllabic consonant) nucleus. The
+		consonants between two vowels start the next syllable from the
+		longest run of rising sonority before its vowel (maximal onset).
+	"""
+	nuclei = [i for i, p in enumerate(phonemes) if phonemeset.stress_type(p) not in [StressType.CONSONANT, StressType.PROSODY]]
+	if not nuclei:
+		return [(list(phonemes), 0)]
+
+	def sonority(phoneme):
+		return max([phoneme_sonority.get(t, 0) for t in phonemeset.types(phoneme)] or [0])
+
+	breaks = [0]
+	for previous, nucleus in zip(nuclei, nuclei[1:]):
+		start = nucleus
+		while start - 1 > previous and sonority(phonemes[start - 1]) < sonority(phonemes[start]):
+			start = start - 1
+		breaks.append(start)
+	breaks.append(len(phonemes))
+
+	syllables = []
+	for start, end in zip(breaks, breaks[1:]):
+		syllable = list(phonemes[start:end])
+		stressed = [p for p in syllable if phonemeset.stress_type(p) in [StressType.PRIMARY_STRESS, StressType.SECONDARY_STRESS]]
+		syllables.append((syllable, 1 if stressed else 0))
+	return syllables
+
+class FestivalLexiconFormatter:
+	"""
+		Write the entries as a compiled festival lexicon, as created by the
+		festival `lex.compile` function.
+
+		The entries are sorted in the order festival's lexicon lookup expects
+		(by the word bytes), and the pronunciations are syllabified, with the
+		stress moved from the vowels to the syllables. The entries are written
+		when the formatter is closed.
+	"""
+
+	def __init__(self, accent=None, phoneset=None, encoding='windows-1252', input_encoding='windows-1252', output=None, error_output=sys.stderr):
+		self.fmt = dict_formats['festlex']
+		if not accent:
+			accent = self.fmt['accent']
+		if not phoneset:
+			phoneset = self.fmt['phoneset']
+		self.converter = load_converter(accent, None, phoneset)
+		self.phonemeset = load_phonemes(accent, 'arpabet')
+		self.encoding = encoding or input_encoding
+		self.output = output or stdout()
+		self.error_output = error_output
+		self.entries = []
+
+	def write(self, word, context, phonemes, comment, meta, error):
+		if error:
+			if self.error_output:
+				print(error, file=self.error_output)
+			return
+		if not word:
+			return
+		word = self.fmt['word'](word).encode(self.encoding)
+		syllables = []
+		for syllable, stress in syllabify(phonemes, self.phonemeset):
+			local = [self.converter.convert(p).rstrip('012') for p in syllable]
+			syllables.append(u'(({0}) {1})'.format(' '.join(local), stress))
+		entry = u'" {0} ({1}))\n'.format(context or 'nil', ' '.join(syllables))
+		self.entries.append((word, len(self.entries), entry.encode(self.encoding)))
+
+	def close(self):
+		self.entries.sort()
+		self.output.write(b'MNCL\n')
+		for word, _, entry in self.entries:
+			self.output.write(b'("' + word + entry)
+		self.entries = []
+
+def create_formatter(dict_format, accent=None, phoneset=None, encoding='windows-1252', input_encoding='windows-1252', output=None, error_output=sys.stderr):
+	if dict_format in ['json']:
+		return JsonFormatter(dict_format, accent, phoneset, encoding, input_encoding, output, error_output)
+	if dict_format in ['festlex-compiled']:
+		return FestivalLexiconFormatter(accent, phoneset, encoding, input_encoding, output, error_output)
+	return TextFormatter(dict_format, accent, phoneset, encoding, input_encoding, output, error_output)
+
+def format_text(dict_format, entries, accent=None, phoneset=None, encoding='windows-1252', input_encoding='windows-1252', output_context=None, rootdir=None, output=None):
+	formatter = TextFormatter(dict_format, accent, phoneset, encoding, input_encoding, output)
+	for entry in entries:
+		formatter.write(*entry)
+	formatter.close()
+
+def format_json(dict_format, entries, accent=None, phoneset=None, encoding='windows-1252', input_encoding='windows-1252', output=None):
+	formatter = JsonFormatter(dict_format, accent, phoneset, encoding, input_encoding, output)
+	for entry in entries:
+		formatter.write(*entry)
+	formatter.close()
+
+def format(dict_format, entries, accent=None, phoneset=None, encoding='windows-1252', input_encoding='windows-1252',  output_context=None, rootdir=None, output=None):
 	if dict_format in ['json']:
-		format_json(dict_format, entries, accent, phoneset, encoding, input_encoding)
+		format_json(dict_format, entries, accent, phoneset, encoding, input_encoding, output)
+	elif dict_format in ['festlex-compiled']:
+		formatter = FestivalLexiconFormatter(accent, phoneset, encoding, input_encoding, output)
+		for entry in entries:
+			formatter.write(*entry)
+		formatter.close()
 	else:
-		format_text(dict_format, entries, accent, phoneset, encoding, input_encoding, output_context, rootdir)
+		format_text(dict_format, entries, accent, phoneset, encoding, input_encoding, output_context, rootdir, output)
 
-def read_file(filename):
+def passthrough(filename, dict_format, accent=None, phoneset=None, encoding='windows-1252', input_encoding='windows-1252', output=None, error_output=sys.stderr, source_accent=None, source_phoneset=None, **kwargs):
+	"""
+		Format the `filename` dictionary as `dict_format`, like `format_text`.
+
+		The lines that would be formatted as the same text are written as the
+		original line bytes instead of being formatted again, so a dictionary
+		that is already in the output format is only validated. The dictionary
+		is parsed using the `source_accent` and `source_phoneset`, and the
+		other arguments are passed to `parse`.
+	"""
+	formatter = TextFormatter(dict_format, accent, phoneset, encoding, input_encoding, output, error_output)
+	output = formatter.output
+	context = ParserContext(passthrough=True)
+	same_encoding = codecs.lookup(formatter.encoding or input_encoding).name == codecs.lookup(input_encoding).name
+	for entry in parse(filename, accent=source_accent, phoneset=source_phoneset, encoding=input_encoding, context=context, **kwargs):
+		if context.line is not None and same_encoding and entry[5] is None and context.format == dict_format and context.phonemeset is formatter.converter.target:
+			output.write(context.line + b'\n')
+			continue
+		formatter.write(*entry)
+		if entry[4] and 'encoding' in entry[4].keys() and not entry[0]: # the input encoding has changed
+			same_encoding = codecs.lookup(formatter.encoding or input_encoding).name == codecs.lookup(entry[4]['encoding'][0]).name
+	formatter.close()
+
+def format_many(entries, formatters):
+	"""
+		Format the entries using each of the formatters in a single pass.
+
+		The validation errors are printed to stderr once, not by each of the
+		text formatters.
+	"""
+	for entry in entries:
+		if entry[5]:
+			print(entry[5], file=sys.stderr)
+		for formatter in formatters:
+			formatter.write(*entry)
+	for formatter in formatters:
+		formatter.close()
+
+sqlite_schema = """
+CREATE TABLE words (
+	id INTEGER PRIMARY KEY,
+	word TEXT NOT NULL
+);
+CREATE TABLE entries (
+	id INTEGER PRIMARY KEY,
+	word_id INTEGER REFERENCES words(id),
+	context TEXT,
+	pronunciation TEXT,
+	phoneme_count INTEGER,
+	comment TEXT
+);
+CREATE TABLE phonemes (
+	entry_id INTEGER NOT NULL REFERENCES entries(id),
+	position INTEGER NOT NULL,
+	phoneme TEXT NOT NULL
+);
+CREATE TABLE metadata (
+	entry_id INTEGER NOT NULL REFERENCES entries(id),
+	key TEXT NOT NULL,
+	value TEXT,
+	json INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+sqlite_indexes = """
+CREATE UNIQUE INDEX words_word ON words (word);
+CREATE INDEX entries_word_id ON entries (word_id);
+CREATE INDEX entries_context ON entries (context);
+CREATE INDEX entries_phoneme_count ON entries (phoneme_count);
+CREATE INDEX phonemes_phoneme ON phonemes (phoneme, position);
+CREATE INDEX phonemes_entry_id ON phonemes (entry_id);
+CREATE INDEX metadata_key ON metadata (key, value);
+CREATE INDEX metadata_entry_id ON metadata (entry_id);
+"""
+
+class SqliteFormatter:
+	"""
+		Write the entries to an SQLite database.
+
+		The entries, line comments, phonemes and metadata are written to the
+		`entries`, `phonemes` and `metadata` tables, with the words in the
+		`words` table. There are no separate variant and comment tables: the
+		variants of a word are the entries with the same word and a different
+		context, the entry comments are in the `comment` column, and line
+		comments are entries without a word. The rows are inserted in batches
+		of `batch_size` rows in a single transaction, and the indexes are
+		created when the formatter is closed.
+	"""
+
+	def __init__(self, filename, error_output=sys.stderr, batch_size=10000):
+		if os.path.exists(filename):
+			os.remove(filename)
+		self.db = sqlite3.connect(filename)
+		self.db.executescript(sqlite_schema)
+		self.error_output = error_output
+		self.batch_size = batch_size
+		self.words = {}
+		self.entries = []
+		self.phonemes = []
+		self.metadata = []
+		self.entry_id = 0
+
+	def write(self, word, context, phonemes, comment, meta, error):
+		if error:
+			if self.error_output:
+				print(error, file=self.error_output)
+			return
+		self.entry_id = self.entry_id + 1
+		word_id = None
+		if word:
+			word_id = self.words.get(word)
+			if word_id is None:
+				word_id = self.words[word] = len(self.words) + 1
+		if phonemes:
+			self.entries.append((self.entry_id, word_id, context, ' '.join(phonemes), len(phonemes), comment))
+			self.phonemes.extend([(self.entry_id, position, phoneme) for position, phoneme in enumerate(phonemes)])
+		else:
+			self.entries.append((self.entry_id, word_id, context, None, None, comment))
+		if meta:
+			for key, values in sorted(meta.items()):
+				if isinstance(values, (list, tuple)):
+					for value in values:
+						if isinstance(value, metadata.string_types):
+							self.metadata.append((self.entry_id, key, value, 0))
+						else:
+							self.metadata.append((self.entry_id, key, json.dumps(value), 1))
+				else:
+					self.metadata.append((self.entry_id, key, json.dumps(values), 2))
+		if len(self.entries) >= self.batch_size:
+			self.flush()
+
+	def flush(self):
+		self.db.executemany('INSERT INTO entries VALUES (?, ?, ?, ?, ?, ?)', self.entries)
+		self.db.executemany('INSERT INTO phonemes VALUES (?, ?, ?)', self.phonemes)
+		self.db.executemany('INSERT INTO metadata VALUES (?, ?, ?, ?)', self.metadata)
+		self.entries = []
+		self.phonemes = []
+		self.metadata = []
+
+	def close(self):
+		self.flush()
+		self.db.executemany('INSERT INTO words VALUES (?, ?)', [(word_id, word) for word, word_id in self.words.items()])
+		self.db.executescript(sqlite_indexes)
+		self.db.commit()
+		self.db.close()
+
+def is_sqlite_database(filename):
+	if not is_filename(filename) or filename == '-' or not os.path.isfile(filename):
+		return False
+	with open(filename, 'rb') as f:
+		return f.read(16) == b'SQLite format 3\x00'
+
+def read_sqlite(filename):
+	"""
+		Read the entries from an SQLite database created by SqliteFormatter,
+		returning (word, context, phonemes, comment, metadata, error) tuples.
+	"""
+	db = sqlite3.connect(filename)
+	try:
+		rows = db.execute('SELECT entry_id, key, value, json FROM metadata ORDER BY entry_id, rowid')
+		row = next(rows, None)
+		query = 'SELECT entries.id, word, context, pronunciation, comment FROM entries LEFT JOIN words ON words.id = entries.word_id ORDER BY entries.id'
+		for entry_id, word, context, pronunciation, comment in db.execute(query):
+			meta = None
+			while row is not None and row[0] == entry_id:
+				_, key, value, is_json = row
+				if meta is None:
+					meta = {}
+				if is_json == 2:
+					meta[key] = json.loads(value)
+				else:
+					meta.setdefault(key, []).append(json.loads(value) if is_json else value)
+				row = next(rows, None)
+			phonemes = pronunciation.split(' ') if pronunciation else None
+			yield word, context, phonemes, comment, meta, None
+	finally:
+		db.close()
+
+class KaldiLexiconFormatter:
+	"""
+		Write the entries to `directory` as the lexicon files used by kaldi
+		and other ASR toolkits:
+			phones.txt            -- the phone symbol table;
+			nonsilence_phones.txt -- the phones, with the stress and word
+			                         position variants of each phone on the
+			                         same line;
+			silence_phones.txt    -- the silence phone (`SIL`);
+			optional_silence.txt  -- the silence phone (`SIL`);
+			words.txt             -- the word symbol table;
+			lexicon.txt           -- the word pronunciations;
+			lexicon.int           -- the word and phone IDs of lexicon.txt;
+			lexicon.bin           -- lexicon.int in binary form.
+
+		The phone IDs are assigned from the phoneset's phone table, not the
+		entries, so they are the same for each dictionary. The words are
+		numbered in the order they are first used. If `stress` is False, the
+		phone tables only contain the phones without stress markers, for
+		entries that have had their stress removed (see `remove_stress`). If
+		`position_dependent` is True, the phones have kaldi's word position
+		suffixes (`_B` begin, `_E` end, `_I` internal and `_S` singleton).
+
+		The syllable breaks are removed from the pronunciations. Entries with
+		phonemes that are not in the phone table are not written, and are
+		reported on stderr. The validation errors are printed to
+		`error_output`.
+
+		The lexicon.bin file uses the following layout, with the words and
+		phones given by their IDs:
+
+			magic (8 bytes) ; count (uint32) ;
+			count * (word (uint32) ; length (uint32) ; phones (length uint32))
+	"""
+
+	magic = b'CMULEXID'
+	positions = ['_B', '_E', '_I', '_S']
+	silence = 'SIL'
+
+	def __init__(self, directory, accent=None, phoneset=None, stress=True, position_dependent=False, error_output=sys.stderr):
+		if not accent:
+			accent = dict_formats['cmudict']['accent']
+		if not phoneset:
+			phoneset = dict_formats['cmudict']['phoneset']
+		if not os.path.exists(directory):
+			os.makedirs(directory)
+		self.converter = load_converter(accent, None, phoneset)
+		self.position_dependent = position_dependent
+		self.error_output = error_output
+		self.directory = directory
+		arpabet = load_phonemes(accent, 'arpabet')
+		self.syllable_breaks = set([p for p, types in arpabet.phone_types.items() if 'syllable' in types])
+		self.syllable_breaks.update([p.lower() for p in self.syllable_breaks])
+
+		groups = collections.OrderedDict()
+		for normalized in sorted(set(self.converter.target.to_arpabet.values()), key=lambda p: (p.rstrip('012'), p)):
+			if not stress and normalized != normalized.rstrip('012'):
+				continue
+			group = groups.setdefault(normalized.rstrip('012'), [])
+			phoneme = self.converter.convert(normalized)
+			if not phoneme in group:
+				group.append(phoneme)
+		suffixes = self.positions if position_dependent else ['']
+		for name in ['silence_phones.txt', 'optional_silence.txt']:
+			with self.open(name) as f:
+				f.write(u'{0}\n'.format(self.silence).encode('utf-8'))
+		with self.open('nonsilence_phones.txt') as f:
+			for group in groups.values():
+				f.write(u'{0}\n'.format(' '.join([p + suffix for p in group for suffix in suffixes])).encode('utf-8'))
+		self.known = set([p for group in groups.values() for p in group])
+		self.phones = {}
+		with self.open('phones.txt') as f:
+			f.write(b'<eps> 0\n')
+			silence = [self.silence] + ([self.silence + suffix for suffix in suffixes] if position_dependent else [])
+			for symbol in silence + [p + suffix for group in groups.values() for p in group for suffix in suffixes]:
+				self.phones[symbol] = len(self.phones) + 1
+				f.write(u'{0} {1}\n'.format(symbol, self.phones[symbol]).encode('utf-8'))
+
+		self.words = {}
+		self.count = 0
+		self.words_file = self.open('words.txt')
+		self.words_file.write(b'<eps> 0\n')
+		self.lexicon_file = self.open('lexicon.txt')
+		self.int_file = self.open('lexicon.int')
+		self.bin_file = self.open('lexicon.bin')
+		self.bin_file.write(self.magic + struct.pack('<I', 0))
+
+	def open(self, name):
+		return open(os.path.join(self.directory, name), 'wb')
+
+	def symbols(self, symbols):
+		if not self.position_dependent:
+			return symbols
+		if len(symbols) == 1:
+			return [symbols[0] + '_S']
+		return [symbols[0] + '_B'] + [p + '_I' for p in symbols[1:-1]] + [symbols[-1] + '_E']
+
+	def write(self, word, context, phonemes, comment, meta, error):
+		if error:
+			if self.error_output:
+				print(error, file=self.error_output)
+			return
+		if not word or not phonemes:
+			return
+		symbols = [self.converter.convert(p) for p in phonemes if not p in self.syllable_breaks]
+		unknown = [p for p in symbols if not p in self.known]
+		if unknown:
+			print(u'Unknown phoneme "{0}" in entry "{1}", not exported'.format(unknown[0], word), file=sys.stderr)
+			return
+		if not symbols:
+			return
+		symbols = self.symbols(symbols)
+		phones = [self.phones[p] for p in symbols]
+		word_id = self.words.get(word)
+		if word_id is None:
+			word_id = self.words[word] = len(self.words) + 1
+			self.words_file.write(u'{0} {1}\n'.format(word, word_id).encode('utf-8'))
+		self.lexicon_file.write(u'{0}\t{1}\n'.format(word, ' '.join(symbols)).encode('utf-8'))
+		self.int_file.write(u'{0} {1}\n'.format(word_id, ' '.join([str(p) for p in phones])).encode('utf-8'))
+		self.bin_file.write(struct.pack('<{0}I'.format(len(phones) + 2), word_id, len(phones), *phones))
+		self.count = self.count + 1
+
+	def close(self):
+		self.bin_file.seek(len(self.magic))
+		self.bin_file.write(struct.pack('<I', self.count))
+		for f in [self.words_file, self.lexicon_file, self.int_file, self.bin_file]:
+			f.close()
+
+def read_kaldi_lexicon(filename):
+	"""
+		Read the (word id, phone ids) entries from a lexicon.bin file.
+	"""
 	with open(filename, 'rb') as f:
-		lines = re.split(b'\r?\n', f.read())
-	if len(lines[-1]) == 0:
-		lines = lines[:-1]
-	return lines
+		data = f.read()
+	if data[0:8] != KaldiLexiconFormatter.magic:
+		raise ValueError('Invalid kaldi lexicon data')
+	count = struct.unpack_from('<I', data, 8)[0]
+	offset = 12
+	for _ in range(count):
+		word_id, length = struct.unpack_from('<II', data, offset)
+		yield word_id, list(struct.unpack_from('<{0}I'.format(length), data, offset + 8))
+		offset = offset + 8 + 4 * length
+
+def is_filename(filename):
+	return isinstance(filename, (str, ustr))
+
+def input_dir(filename):
+	"""
+		The directory used to resolve relative metadata file paths.
+	"""
+	if not is_filename(filename):
+		filename = getattr(filename, 'name', '-')
+	if filename != '-':
+		return os.path.dirname(filename)
+	return ''
+
+def open_xz(filename, mode='rb'):
+	if not lzma:
+		raise Exception('`xz` compression not supported (install the `backports.lzma` module to use this format)')
+	return lzma.open(filename, mode)
+
+compression_formats = {
+	'.bz2': bz2.BZ2File,
+	'.gz':  gzip.open,
+	'.xz':  open_xz,
+}
+
+def strip_compression_suffix(filename):
+	for suffix in compression_formats.keys():
+		if filename.endswith(suffix):
+			return filename[:-len(suffix)]
+	return filename
+
+def open_file(filename, mode='rb'):
+	"""
+		Open the file, compressing or decompressing it based on the file
+		extension (`.bz2`, `.gz` or `.xz`).
+	"""
+	for suffix, open_compressed in compression_formats.items():
+		if filename.endswith(suffix):
+			return open_compressed(filename, mode)
+	return open(filename, mode)
+
+def decompress_stream(f):
+	"""
+		Decompress the stream if it starts with a bzip2, gzip or xz header.
+	"""
+	if not hasattr(f, 'peek'):
+		return f # unable to detect the compression format
+	header = f.peek(10)
+	if header.startswith(b'\x1f\x8b'):
+		return gzip.GzipFile(fileobj=f, mode='rb')
+	if header.startswith(b'BZh') and header[4:10] == b'1AY&SY':
+		return bz2.BZ2File(f, 'rb')
+	if header.startswith(b'\xfd7zXZ\x00'):
+		return open_xz(f, 'rb')
+	return f
+
+def read_file(filename):
+	"""
+		Read the lines from the dictionary, without the line endings.
+
+		The dictionary can be a file name, `-` for stdin, or a file-like
+		object or other iterable over the (byte string) lines in the
+		dictionary. The lines are read as they are needed, so this can be
+		used to process the output of another program. Compressed files and
+		streams are decompressed as they are read. A shard manifest (`.shards`)
+		file is read as the joined shards.
+	"""
+	if is_filename(filename) and filename.endswith(shard_manifest_suffix):
+		for line in join_lines([filename]):
+			yield line
+		return
+	if not is_filename(filename):
+		f = filename
+	elif filename == '-':
+		f = decompress_stream(stdin())
+	else:
+		f = open_file(filename, 'rb')
+	try:
+		for line in f:
+			if line.endswith(b'\n'):
+				line = line[:-1]
+				if line.endswith(b'\r'):
+					line = line[:-1]
+			yield line
+	finally:
+		if is_filename(filename) and filename != '-':
+			f.close()
 
 class InvalidWarning(ValueError):
 	def __init__(self, message):
 		ValueError.__init__(self, message)
 
 def warnings_to_checks(warnings):
-	checks = default_warnings
+	checks = list(default_warnings)
 	for warning in warnings:
 		if warning == 'all':
 			checks = list(parser_warnings.keys())
@@ -618,16 +2040,83 @@ def is_check_enabled(check, checks, metadata):
 		return False # locally disabled
 	return check in checks
 
+class ParserContext:
+	"""
+		The state of a single parse of the `filename` dictionary.
+
+		Nothing is shared between parser contexts, so different dictionaries
+		can be parsed at the same time (e.g. on a thread pool), each with its
+		own checks.
+	"""
+
+	def __init__(self, filename=None, checks=None, encoding='windows-1252', passthrough=False):
+		self.filename = filename
+		self.checks = checks
+		self.encoding = encoding
+		self.line_number = 0
+		self.passthrough = passthrough
+		self.raw_line = None
+		self.line = None
+		self.format = None
+		self.phonemeset = None
+
+	def rootdir(self):
+		return input_dir(self.filename)
+
+	def count_lines(self, lines):
+		if self.passthrough:
+			for line in lines:
+				self.line_number += 1
+				self.raw_line = line
+				self.line = None
+				yield line
+			return
+		for line in lines:
+			self.line_number += 1
+			yield line
+
+	def keep_line(self, fmt, line, word, context, phonemes, comment):
+		"""
+			Set `line` to the original bytes of the line if `fmt` formats the
+			entry as the same text (see `TextFormatter`).
+		"""
+		components = []
+		if word:
+			components.append('entry')
+			word = fmt['word'](word)
+		if context:
+			components.append('context')
+		if comment is not None:
+			if fmt['have-comments']:
+				components.append('comment')
+			elif not word: # line comment
+				return
+		if not components:
+			text = u'\n'
+		else:
+			text = fmt['-'.join(components)].format(word, context, phonemes, comment)
+		if text[:-1] == line:
+			self.line = self.raw_line
+
+	def error(self, check, message, *args):
+		error = ParseError(check, message, *args)
+		error.line_number = self.line_number
+		return error
+
 def parse_comment_string(comment, parser, values=None):
-	re_key   = re.compile(r'^[a-zA-Z0-9_\-]+$')
-	re_value = re.compile(r'^[^\x00-\x20\x7F-\xFF"]+$')
 	if comment.startswith('@@'):
 		_, metastring, comment = comment.split('@@')
 		meta, errors = parser(metastring, values=values)
 		return comment, meta, errors
 	return comment, None, []
 
-def parse_festlex(lines, checks, encoding):
+re_festlex_entry = re.compile(r'^\("([^"]+)" ([a-zA-Z0-9_]+) \(([^\)]+)\)[ \t]*\)[ \t]*(;(.*))?[ \t]*$')
+
+re_cmudict_word = re.compile(dict_formats['cmudict']['word-validation'])
+
+re_cmudict_entry = re.compile(r'^([^ \t][^ \t(]*)(\(([^\)]*)\))?([ \t]+)([^#]+)( #(.*))?[ \t]*$')
+
+def parse_festlex(lines, checks, encoding, parser_context=None):
 	"""
 		Parse the entries in a festlex formatted dictionary (e.g. festlex-cmu).
 
@@ -636,7 +2125,7 @@ def parse_festlex(lines, checks, encoding):
 	"""
 
 	re_linecomment = re.compile(r'^;;(.*)$')
-	re_entry = re.compile(r'^\("([^"]+)" ([a-zA-Z0-9_]+) \(([^\)]+)\)[ \t]*\)[ \t]*(;(.*))?[ \t]*$')
+	re_entry = re_festlex_entry
 	format = 'festlex'
 	for line in lines:
 		line = line.decode(encoding)
@@ -648,13 +2137,13 @@ def parse_festlex(lines, checks, encoding):
 		if m:
 			comment, meta, errors = parse_comment_string(m.group(1), metadata.parse_key_values)
 			for message in errors:
-				yield line, format, None, None, None, None, None, '{0} in entry: "{1}"'.format(message, line)
+				yield line, format, None, None, None, None, None, ParseError('invalid-metadata', u'{0} in entry: "{1}"', message, line)
 			yield line, format, None, None, None, comment, meta, None
 			continue
 
 		m = re_entry.match(line)
 		if not m:
-			yield line, format, None, None, None, None, None, 'Unsupported entry: "{0}"'.format(line)
+			yield line, format, None, None, None, None, None, ParseError('unsupported-entry', u'Unsupported entry: "{0}"', line)
 			continue
 
 		word = m.group(1)
@@ -665,25 +2154,27 @@ def parse_festlex(lines, checks, encoding):
 		if comment:
 			comment, meta, errors = parse_comment_string(comment, metadata.parse_key_values)
 			for message in errors:
-				yield line, format, None, None, None, None, None, '{0} in entry: "{1}"'.format(message, line)
+				yield line, format, None, None, None, None, None, ParseError('invalid-metadata', u'{0} in entry: "{1}"', message, line)
 
 		if context == 'nil':
 			context = None
 
 		yield line, format, word, context, phonemes, comment, meta, None
 
-def parse_cmudict(lines, checks, encoding):
+def parse_cmudict(lines, checks, encoding, parser_context=None):
 	"""
-		Parse the entries in the cmudict file.
+		Parse the entries in the cmudict file. The `parser_context` is the
+		ParserContext used to locate file-based metadata; if it is None,
+		the entry metadata values are not validated against those files.
 
 		The return value is of the form:
 			(line, format, word, context, phonemes, comment, error)
 	"""
 	re_linecomment_weide = re.compile(r'^##(.*)$')
 	re_linecomment_air   = re.compile(r'^;;;(.*)$')
-	re_entry = re.compile(r'^([^ \t][^ \t(]*)(\(([^\)]*)\))?([ \t]+)([^#]+)( #(.*))?[ \t]*$')
+	re_entry = re_cmudict_entry
 	format = None
-	entry_metadata = {}
+	entry_metadata = metadata.FrozenMetadata()
 	metaparser = metadata.parse_key_values
 
 	for line in lines:
@@ -705,7 +2196,7 @@ def parse_cmudict(lines, checks, encoding):
 
 		if comment is not None:
 			for message in errors:
-				yield line, format, None, None, None, None, None, '{0} in entry: "{1}"'.format(message, line)
+				yield line, format, None, None, None, None, None, ParseError('invalid-metadata', u'{0} in entry: "{1}"', message, line)
 			if meta:
 				if 'format' in meta.keys():
 					format = meta['format'][0]
@@ -714,16 +2205,16 @@ def parse_cmudict(lines, checks, encoding):
 					else:
 						spacing = '  '
 				if 'metadata' in meta.keys():
-					if not entry_metadata:
-						entry_metadata = {}
+					validators = dict(entry_metadata)
 					entry = meta['metadata'][0]
 					if entry.startswith('@'):
 						t, key = entry[1:].split(':')
-						entry_metadata[key] = TypeValidator(t)
-					else:
-						path = os.path.join(os.path.dirname(filename), entry)
+						validators[key] = TypeValidator(t)
+					elif parser_context: # the metadata file is relative to the dictionary
+						path = os.path.join(parser_context.rootdir(), entry)
 						for key, value in metadata.parse(path).items():
-							entry_metadata[key] = SetValidator(value)
+							validators[key] = SetValidator(value)
+					entry_metadata = metadata.FrozenMetadata(validators) # hashable, for the metadata cache
 				if 'encoding' in meta.keys():
 					encoding = meta['encoding'][0]
 				if 'metadata-format' in meta.keys():
@@ -735,15 +2226,15 @@ def parse_cmudict(lines, checks, encoding):
 				else:
 					spacing = '  '
 			if format != 'cmudict-weide' and comment_format == 'cmudict-weide':
-				yield line, format, None, None, None, None, None, u'Old-style comment: "{0}"'.format(line)
+				yield line, format, None, None, None, None, None, ParseError('comment-style', u'Old-style comment: "{0}"', line)
 			elif format == 'cmudict-weide' and comment_format == 'cmudict-air':
-				yield line, format, None, None, None, None, None, u'New-style comment: "{0}"'.format(line)
+				yield line, format, None, None, None, None, None, ParseError('comment-style', u'New-style comment: "{0}"', line)
 			yield line, format, None, None, None, comment, meta, None
 			continue
 
 		m = re_entry.match(line)
 		if not m:
-			yield line, format, None, None, None, None, None, u'Unsupported entry: "{0}"'.format(line)
+			yield line, format, None, None, None, None, None, ParseError('unsupported-entry', u'Unsupported entry: "{0}"', line)
 			continue
 
 		word = m.group(1)
@@ -755,11 +2246,10 @@ def parse_cmudict(lines, checks, encoding):
 		if comment:
 			comment, meta, errors = parse_comment_string(comment, metaparser, values=entry_metadata)
 			for message in errors:
-				yield line, format, None, None, None, None, None, u'{0} in entry: "{1}"'.format(message, line)
+				yield line, format, None, None, None, None, None, ParseError('invalid-metadata', u'{0} in entry: "{1}"', message, line)
 
 		if not format or format == 'cmudict-air': # detect the dictionary format ...
-			cmudict_fmt = re.compile(dict_formats['cmudict']['word-validation'])
-			if cmudict_fmt.match(word):
+			if re_cmudict_word.match(word):
 				format = 'cmudict'
 				spacing = '  '
 			else:
@@ -767,19 +2257,39 @@ def parse_cmudict(lines, checks, encoding):
 				spacing = ' '
 
 		if word_phoneme_space != spacing and is_check_enabled('entry-spacing', checks, meta):
-			yield line, format, None, None, None, None, None, u'Entry needs {0} spaces between word and phoneme: "{1}"'.format(len(spacing), line)
+			yield line, format, None, None, None, None, None, ParseError('entry-spacing', u'Entry needs {0} spaces between word and phoneme: "{1}"', len(spacing), line)
 
 		if phonemes.endswith(' ') and is_check_enabled('trailing-whitespace', checks, meta):
-			yield line, format, None, None, None, None, None, u'Trailing whitespace in entry: "{0}"'.format(line)
+			yield line, format, None, None, None, None, None, ParseError('trailing-whitespace', u'Trailing whitespace in entry: "{0}"', line)
 
 		yield line, format, word, context, phonemes, comment, meta, None
 
+def detect_dict_parser(lines, default=parse_cmudict):
+	"""
+		Detect the dictionary format from the first entry in the dictionary.
+
+		This returns the parser for the format and the dictionary lines,
+		including the lines that were read to detect the format.
+	"""
+	dict_parser = default
+	detected = []
+	for line in lines:
+		detected.append(line)
+		if line.startswith(b'("'):
+			dict_parser = parse_festlex
+		elif line == b'' or line.startswith(b';;') or line.startswith(b'##'):
+			continue # blank line or line comment
+		else:
+			dict_parser = parse_cmudict
+		break
+	return dict_parser, itertools.chain(detected, lines)
+
 def setup_dict_parser(filename):
-	if filename.endswith('.scm'):
-		dict_parser = parse_festlex
+	if is_filename(filename) and strip_compression_suffix(filename).endswith('.scm'):
+		default = parse_festlex
 	else:
-		dict_parser = parse_cmudict
-	return dict_parser, read_file(filename)
+		default = parse_cmudict
+	return detect_dict_parser(read_file(filename), default)
 
 class ConflictType:
 	BASE  = 'B'
@@ -794,6 +2304,7 @@ class DiffType:
 	LEFT  = 'L' # left has been modified
 	RIGHT = 'R' # right has been modified
 	BOTH  = 'B' # both left and right have been modified
+	COPY  = 'C' # unconflicted lines copied from the input
 
 def diff2_line(yours, theirs):
 	if yours == theirs:
@@ -809,40 +2320,85 @@ def diff3_line(yours, theirs, base):
 		return DiffType.LEFT, yours, theirs
 	return DiffType.BOTH, yours, theirs
 
+re_conflict = re.compile(br'^<<<<<<<[^\n]*\n(.*?)^=======[^\n]*\n(.*?)^>>>>>>>[^\n]*(?:\n|\Z)', re.M | re.S)
+
+def read_data(filename):
+	"""
+		Read the dictionary as a single byte string.
+	"""
+	if is_filename(filename) and filename != '-' and not filename.endswith(shard_manifest_suffix):
+		with open_file(filename, 'rb') as f:
+			return f.read()
+	return b''.join([line + b'\n' for line in read_file(filename)])
+
+def conflict_regions(data):
+	"""
+		Split the `data` of a file with git conflict markers into regions.
+
+		The unconflicted regions are yielded as (data, None), where `data` is
+		the original bytes, and the conflicts are yielded as (yours, theirs),
+		where each is a list of the line bytes.
+	"""
+	position = 0
+	for m in re_conflict.finditer(data):
+		if m.start() > position:
+			yield data[position:m.start()], None
+		yield m.group(1).splitlines(), m.group(2).splitlines()
+		position = m.end()
+	if position < len(data):
+		yield data[position:], None
+
+def is_header_line(line):
+	return line == b'' or line.startswith(b';;') or line.startswith(b'##')
+
+def diff_conflicts(filename, encoding='windows-1252'):
+	"""
+		Compare the yours and theirs sides of the git conflicts in `filename`.
+
+		The unconflicted regions are yielded as (DiffType.COPY, data, data)
+		with the original bytes, so only the conflicts are parsed. The line
+		comments at the start of the file are parsed before each conflict, so
+		the format and encoding metadata apply to the conflict entries.
+	"""
+	data = read_data(filename)
+	memory_checkpoint('diff')
+	lines = (line.rstrip(b'\r\n') for line in io.BytesIO(data))
+	if is_filename(filename) and strip_compression_suffix(filename).endswith('.scm'):
+		dict_parser, _ = detect_dict_parser(lines, parse_festlex)
+	else:
+		dict_parser, _ = detect_dict_parser(lines, parse_cmudict)
+	header = []
+	for line in io.BytesIO(data):
+		line = line.rstrip(b'\r\n')
+		if not is_header_line(line):
+			break
+		header.append(line)
+	for lines1, lines2 in conflict_regions(data):
+		if lines2 is None:
+			yield DiffType.COPY, lines1, lines1
+			continue
+		dict1 = dict_parser(itertools.chain(header, lines1), [], encoding, ParserContext(filename, [], encoding))
+		dict2 = dict_parser(itertools.chain(header, lines2), [], encoding, ParserContext(filename, [], encoding))
+		for entry in itertools.islice(diff_entries(dict1, dict2), len(header), None):
+			yield entry
+
 def diff_dict(yours, theirs, base, encoding='windows-1252'):
 	if not theirs:
-		dict_parser, lines = setup_dict_parser(yours)
-		dict1_parser = dict2_parser = dict_parser
-		lines1 = []
-		lines2 = []
-		mode = ConflictType.BASE
-		for line in lines:
-			if line.startswith('<<<<<<<'):
-				mode = ConflictType.LEFT
-				continue
-			if line.startswith('======='):
-				mode = ConflictType.RIGHT
-				continue
-			if line.startswith('>>>>>>>'):
-				mode = ConflictType.BASE
-				continue
-			if mode == ConflictType.BASE or mode == ConflictType.LEFT:
-				lines1.append(line)
-			if mode == ConflictType.BASE or mode == ConflictType.RIGHT:
-				lines2.append(line)
-	else:
-		dict1_parser, lines1 = setup_dict_parser(yours)
-		dict2_parser, lines2 = setup_dict_parser(theirs)
+		return diff_conflicts(yours, encoding)
 
-	dict1 = dict1_parser(lines1, [], encoding)
-	dict2 = dict2_parser(lines2, [], encoding)
+	dict1_parser, lines1 = setup_dict_parser(yours)
+	dict2_parser, lines2 = setup_dict_parser(theirs)
+	dict1 = dict1_parser(lines1, [], encoding, ParserContext(yours, [], encoding))
+	dict2 = dict2_parser(lines2, [], encoding, ParserContext(theirs, [], encoding))
 	if base:
 		dict_parser, lines = setup_dict_parser(base)
-		dict3 = dict_parser(lines, [], encoding)
+		dict3 = dict_parser(lines, [], encoding, ParserContext(base, [], encoding))
 	else:
 		dict3 = None
-		line3 = word3 = comment3 = None
+	return diff_entries(dict1, dict2, dict3)
 
+def diff_entries(dict1, dict2, dict3=None):
+	line3 = word3 = comment3 = None
 	need_entry1 = True
 	need_entry2 = True
 	need_entry3 = True
@@ -908,7 +2464,7 @@ def diff_dict(yours, theirs, base, encoding='windows-1252'):
 			yield DiffType.INS, None, line2
 			need_entry2 = True
 			continue
-		if word1 < word3:
+		if word3 and word1 < word3:
 			need_entry3 = True
 			continue
 		if dict3:
@@ -918,56 +2474,867 @@ def diff_dict(yours, theirs, base, encoding='windows-1252'):
 		need_entry1 = need_entry2 = need_entry3 = True
 
 def diff(yours, theirs, base, encoding='windows-1252'):
+	output = stdout()
 	if not theirs:
-		print('--- a/{0}'.format(yours))
-		print('+++ b/{0}'.format(yours))
+		fprintf(output, '--- a/{0}\n', encoding, yours)
+		fprintf(output, '+++ b/{0}\n', encoding, yours)
 	else:
-		print('--- {0}'.format(yours))
-		print('+++ {0}'.format(theirs))
+		fprintf(output, '--- {0}\n', encoding, yours)
+		fprintf(output, '+++ {0}\n', encoding, theirs)
 	for match, line1, line2 in diff_dict(yours, theirs, base, encoding):
-		if match == DiffType.MATCH:
-			print(' {0}'.format(line1))
+		if match == DiffType.COPY:
+			for line in line1.splitlines():
+				output.write(b' ' + line + b'\n')
+		elif match == DiffType.MATCH:
+			fprintf(output, ' {0}\n', encoding, line1)
 		elif match in [ DiffType.BOTH, DiffType.LEFT, DiffType.RIGHT ]:
-			print('-{0}'.format(line1))
-			print('+{0}'.format(line2))
+			fprintf(output, '-{0}\n', encoding, line1)
+			fprintf(output, '+{0}\n', encoding, line2)
 		elif match == DiffType.DEL:
-			print('-{0}'.format(line1))
+			fprintf(output, '-{0}\n', encoding, line1)
 		elif match == DiffType.INS:
-			print('+{0}'.format(line2))
+			fprintf(output, '+{0}\n', encoding, line2)
 
 def merge(yours, theirs, base, encoding='windows-1252'):
+	output = stdout()
 	for match, line1, line2 in diff_dict(yours, theirs, base, encoding):
-		if match == DiffType.MATCH:
-			print(line1)
+		if match == DiffType.COPY:
+			output.write(line1)
+			if not line1.endswith(b'\n'):
+				output.write(b'\n')
+		elif match == DiffType.MATCH:
+			fprintf(output, '{0}\n', encoding, line1)
 		elif match == DiffType.BOTH:
-			print('<<<<<<<')
-			print(line1)
-			print('=======')
-			print(line2)
-			print('>>>>>>>')
+			fprintf(output, '<<<<<<<\n{0}\n=======\n{1}\n>>>>>>>\n', encoding, line1, line2)
 		elif match in [ DiffType.LEFT, DiffType.DEL ]:
-			print(line1)
+			fprintf(output, '{0}\n', encoding, line1)
 		elif match in [ DiffType.RIGHT, DiffType.INS ]:
-			print(line2)
+			fprintf(output, '{0}\n', encoding, line2)
+
+# Change type for entry-level deltas.
+class DeltaType:
+	ADD    = '+' # the entry has been added
+	REMOVE = '-' # the entry has been removed
+	CHANGE = '~' # the entry has been modified
+
+def entry_fields(line, dict_parser, encoding='windows-1252'):
+	"""
+		Get the (word, context, pronunciation) fields for an entry line, or
+		None if the line is not an entry. The fields are not validated.
+	"""
+	line = line.decode(encoding)
+	if dict_parser == parse_festlex:
+		m = re_festlex_entry.match(line)
+		if not m:
+			return None
+		return m.group(1), None if m.group(2) == 'nil' else m.group(2), ' '.join(m.group(3).split())
+	m = re_cmudict_entry.match(line)
+	if not m or line.startswith(';;;') or line.startswith('##'):
+		return None
+	return m.group(1), m.group(3), ' '.join(m.group(5).split())
+
+def entry_key(line, dict_parser, encoding='windows-1252'):
+	"""
+		Get the (word, context) key for an entry line, or None if the line is
+		not an entry. The rest of the entry is not parsed or validated.
+	"""
+	fields = entry_fields(line, dict_parser, encoding)
+	if not fields:
+		return None
+	return fields[0], fields[1]
+
+def line_metadata(line, encoding='windows-1252'):
+	line = line.decode(encoding)
+	for prefix in [';;;', '##', ';;']:
+		if line.startswith(prefix):
+			_, meta, _ = parse_comment_string(line[len(prefix):], metadata.parse_key_values)
+			return meta
+	return None
+
+def read_entry_lines(filename, encoding='windows-1252'):
+	dict_parser, lines = setup_dict_parser(filename)
+	for line in lines:
+		yield entry_key(line, dict_parser, encoding), line
+
+def create_delta(base, target, encoding='windows-1252'):
+	"""
+		Compare the entries in the base and target dictionaries, returning
+		(change, line) pairs, where `change` is a `DeltaType` value.
+
+		The entries are matched by their (word, context) key, so the
+		dictionaries do not need to be sorted. Changes to line comments are
+		not included.
+
+		The base dictionary is read twice, and the entry lines of the base
+		dictionary and the keys of the target dictionary are kept in memory.
+		A ValueError is raised if an entry is in the base dictionary more
+		than once, before any changes are returned.
+	"""
+	base_lines = {}
+	for key, line in read_entry_lines(base, encoding):
+		if not key:
+			continue
+		if key in base_lines:
+			raise ValueError(u'Duplicate entry in the base dictionary: "{0}"'.format(line.decode(encoding)))
+		base_lines[key] = line
+	memory_checkpoint('delta')
+	target_keys = set()
+	for key, line in read_entry_lines(target, encoding):
+		if not key or key in target_keys:
+			continue
+		target_keys.add(key)
+		if not key in base_lines:
+			yield DeltaType.ADD, line
+		elif base_lines[key] != line:
+			yield DeltaType.CHANGE, line
+	for key, line in read_entry_lines(base, encoding):
+		if key and not key in target_keys:
+			target_keys.add(key)
+			yield DeltaType.REMOVE, line
+
+def read_delta(filename, dict_parser, encoding='windows-1252'):
+	changes = {}
+	added = []
+	for line in read_file(filename):
+		if line == b'':
+			continue
+		change, line = line[0:1].decode('ascii'), line[2:]
+		key = entry_key(line, dict_parser, encoding)
+		if not change in [DeltaType.ADD, DeltaType.REMOVE, DeltaType.CHANGE] or not key:
+			raise ValueError(u'Invalid delta: "{0}"'.format(line.decode(encoding)))
+		if change == DeltaType.ADD:
+			added.append((key, line))
+		else:
+			changes[key] = (change, line)
+	memory_checkpoint('patch')
+	return changes, added
+
+# The checks that need the other entries in the dictionary.
+dictionary_checks = ['unsorted', 'context-ordering', 'duplicate-entries', 'duplicate-pronunciations']
+
+def validate_entry_lines(header, lines, filename, warnings=[], encoding='windows-1252', accent=None, phoneset=None):
+	"""
+		Validate the entry `lines` using the `header` line comments of the
+		`filename` dictionary, returning the errors. The `dictionary_checks`
+		are not performed, as the other entries are not available.
+	"""
+	data = io.BytesIO(b''.join([line + b'\n' for line in header + lines]))
+	if is_filename(filename):
+		data.name = filename # for the relative metadata file paths
+	warnings = list(warnings) + ['no-{0}'.format(check) for check in dictionary_checks]
+	entries = parse(data, warnings=warnings, encoding=encoding, accent=accent, phoneset=phoneset)
+	return [error for word, context, phonemes, comment, meta, error in entries if error]
+
+def apply_delta(base, delta, encoding='windows-1252', sort_mode=None, warnings=[], accent=None, phoneset=None):
+	"""
+		Apply the delta to the base dictionary, returning the patched lines.
+
+		This is a single pass over the base dictionary. The lines that are
+		not changed are returned as is, without being parsed or validated.
+		The added and changed entries are validated with the `warnings`
+		checks, using the line comments at the start of the base dictionary,
+		and a ValueError is raised if they have any errors. The added
+		entries are merged into the dictionary in `sort_mode` order, or the
+		file's `sorting` order if not specified, or are added to the end of
+		the dictionary if there is no sort order.
+	"""
+	dict_parser, lines = setup_dict_parser(base)
+	changes, added = read_delta(delta, dict_parser, encoding)
+	added_keys = set([key for key, line in added])
+	sort_key = None
+	if sort_mode:
+		sort_key = create_sort_key(sort_mode)
+		added.sort(key=lambda x: sort_key(sort_keyword(x[0][0], x[0][1], sort_mode)))
+	pending = 0
+	header = []
+	validated = False
+
+	def validate():
+		new_lines = [line for key, line in added] + [line for key, (change, line) in changes.items() if change == DeltaType.CHANGE]
+		errors = validate_entry_lines(header, new_lines, base, warnings, encoding, accent, phoneset)
+		if errors:
+			raise ValueError(u'Invalid entries in the delta:\n{0}'.format(u'\n'.join([ustr(e) for e in errors])))
+
+	for line in lines:
+		key = entry_key(line, dict_parser, encoding)
+		if not key and not validated:
+			header.append(line)
+		elif not validated:
+			validate()
+			validated = True
+		if not key:
+			meta = line_metadata(line, encoding)
+			if meta and 'sorting' in meta.keys() and not sort_mode:
+				sort_mode = meta['sorting'][0]
+				sort_key = create_sort_key(sort_mode)
+				added.sort(key=lambda x: sort_key(sort_keyword(x[0][0], x[0][1], sort_mode)))
+			yield line
+			continue
+		if sort_key:
+			keyword = sort_key(sort_keyword(key[0], key[1], sort_mode))
+			while pending < len(added) and sort_key(sort_keyword(added[pending][0][0], added[pending][0][1], sort_mode)) < keyword:
+				yield added[pending][1]
+				pending = pending + 1
+		if key in added_keys:
+			raise ValueError(u'Entry already in the dictionary: "{0}"'.format(line.decode(encoding)))
+		if key in changes:
+			change, newline = changes.pop(key)
+			if change == DeltaType.CHANGE:
+				yield newline
+			continue
+		yield line
+	if not validated:
+		validate()
+	for key, line in added[pending:]:
+		yield line
+	for key, (change, line) in changes.items():
+		raise ValueError(u'Entry not in the dictionary: "{0}"'.format(line.decode(encoding)))
+
+def set_entry_context(line, context, dict_parser, encoding='windows-1252'):
+	"""
+		Change the context of a cmudict entry line. Festlex entries are
+		returned as is, as the context is a part-of-speech tag.
+	"""
+	if dict_parser == parse_festlex:
+		return line
+	text = line.decode(encoding)
+	m = re_cmudict_entry.match(text)
+	start = m.end(1)
+	end = m.end(2) if m.group(2) else start
+	if context is None:
+		text = text[:start] + text[end:]
+	else:
+		text = u'{0}({1}){2}'.format(text[:start], context, text[end:])
+	return text.encode(encoding)
+
+def set_entry_word(line, word, dict_parser, encoding='windows-1252'):
+	"""
+		Change the word of an entry line, keeping the rest of the line.
+	"""
+	text = line.decode(encoding)
+	if dict_parser == parse_festlex:
+		m = re_festlex_entry.match(text)
+	else:
+		m = re_cmudict_entry.match(text)
+	if m.group(1) == word:
+		return line
+	text = u'{0}{1}{2}'.format(text[:m.start(1)], word, text[m.end(1):])
+	return text.encode(encoding)
+
+def insert_entries(base, entries, encoding='windows-1252', sort_mode=None, order_from=0):
+	"""
+		Insert the entries into the sorted base dictionary, returning
+		(line, error) pairs.
+
+		The entries are sorted using `sort_mode`, or the file's `sorting`
+		order if not specified, and merged into the base dictionary in a
+		single pass. New pronunciations for a word in the base dictionary are
+		added after the existing entries for that word, with the context
+		numbered after the existing variants. Entries with a pronunciation
+		that is already in the dictionary for that word are not added, and
+		are reported as errors.
+
+		Words are matched and ordered ignoring case, and the inserted entries
+		are written using the spelling of the word in the base dictionary,
+		or the letter case of the base dictionary entries for new words.
+	"""
+	dict_parser, lines = setup_dict_parser(base)
+
+	batch = {}
+	for line in read_file(entries):
+		fields = entry_fields(line, dict_parser, encoding)
+		if fields:
+			batch.setdefault(fields[0].upper(), []).append((fields[0], fields[2], line))
+		elif line != b'':
+			yield None, u'Unsupported entry: "{0}"'.format(line.decode(encoding))
+	memory_checkpoint('insert')
+	words = list(batch.keys())
+	sort_key = create_sort_key(sort_mode)
+	words.sort(key=sort_key)
+
+	def context_number(context):
+		if context is None:
+			return order_from
+		try:
+			return int(context)
+		except ValueError:
+			return None
+
+	lower_case = None
+	def insert_word(word, group, spelling=None):
+		pronunciations = [pronunciation for context, pronunciation in group]
+		contexts = [context_number(context) for context, pronunciation in group]
+		contexts = [context for context in contexts if context is not None]
+		for entry_word, pronunciation, line in batch.pop(word, []):
+			if pronunciation in pronunciations:
+				yield None, u'Duplicate entry: "{0}"'.format(line.decode(encoding))
+				continue
+			if spelling is None:
+				spelling = entry_word.lower() if lower_case else entry_word.upper()
+			line = set_entry_word(line, spelling, dict_parser, encoding)
+			if not group:
+				context = None
+				contexts.append(order_from)
+			else:
+				context = max(contexts) + 1 if contexts else order_from + 1
+				contexts.append(context)
+			group.append((context, pronunciation))
+			pronunciations.append(pronunciation)
+			yield set_entry_context(line, context, dict_parser, encoding), None
+
+	pending = 0
+	current_word = None
+	current_spelling = None
+	group = []
+	for line in lines:
+		fields = entry_fields(line, dict_parser, encoding)
+		if fields and fields[0].upper() == current_word:
+			group.append((fields[1], fields[2]))
+			yield line, None
+			continue
+		if current_word is not None:
+			for ret in insert_word(current_word, group, current_spelling):
+				yield ret
+			current_word = None
+		if not fields:
+			meta = line_metadata(line, encoding)
+			if meta and not sort_mode and 'sorting' in meta.keys():
+				sort_mode = meta['sorting'][0]
+				sort_key = create_sort_key(sort_mode)
+				words[pending:] = sorted(words[pending:], key=sort_key)
+			if meta and 'order-from' in meta.keys():
+				order_from = int(meta['order-from'][0])
+			yield line, None
+			continue
+		if lower_case is None:
+			lower_case = fields[0] != fields[0].upper()
+		keyword = sort_key(fields[0].upper())
+		while pending < len(words) and sort_key(words[pending]) < keyword:
+			if words[pending] in batch:
+				for ret in insert_word(words[pending], []):
+					yield ret
+			pending = pending + 1
+		current_word = fields[0].upper()
+		current_spelling = fields[0]
+		group = [(fields[1], fields[2])]
+		yield line, None
+	if current_word is not None:
+		for ret in insert_word(current_word, group, current_spelling):
+			yield ret
+	for word in words[pending:]:
+		if word in batch:
+			for ret in insert_word(word, []):
+				yield ret
+
+def insert(base, entries, encoding='windows-1252', sort_mode=None, order_from=0):
+	output = stdout()
+	for line, error in insert_entries(base, entries, encoding, sort_mode, order_from):
+		if error:
+			output.flush()
+			print(error, file=sys.stderr)
+		else:
+			output.write(line + b'\n')
+
+def delta(base, target, encoding='windows-1252'):
+	output = stdout()
+	for change, line in create_delta(base, target, encoding):
+		output.write(change.encode('ascii') + b' ' + line + b'\n')
+
+def patch(base, delta, encoding='windows-1252', sort_mode=None, warnings=[], accent=None, phoneset=None):
+	"""
+		Write the patched dictionary to stdout. The patched lines are written
+		to a temporary file first, so nothing is written if the delta cannot
+		be applied.
+	"""
+	with tempfile.SpooledTemporaryFile(max_size=1024*1024) as f:
+		for line in apply_delta(base, delta, encoding, sort_mode, warnings, accent, phoneset):
+			f.write(line + b'\n')
+		f.seek(0)
+		shutil.copyfileobj(f, stdout())
+
+class EntryStatistics:
+	"""
+		The number of entries, words and variants.
+	"""
+
+	title = 'Entries'
+
+	def __init__(self):
+		self.entries = 0
+		self.words = 0
+		self.variants = 0
+		self.previous_word = None
+
+	def add(self, word, context, phonemes, comment, meta, error):
+		if word:
+			self.entries = self.entries + 1
+			if context:
+				self.variants = self.variants + 1
+			if word != self.previous_word:
+				self.words = self.words + 1
+				self.previous_word = word
+
+	def merge(self, other):
+		self.entries = self.entries + other.entries
+		self.words = self.words + other.words
+		self.variants = self.variants + other.variants
+
+	def results(self):
+		return {'entries': self.entries, 'words': self.words, 'variants': self.variants}
+
+	def format(self):
+		yield 'Entries:  {0}'.format(self.entries)
+		yield 'Words:    {0}'.format(self.words)
+		yield 'Variants: {0}'.format(self.variants)
+
+class CountStatistics:
+	"""
+		The base class for statistics that count the number of times each
+		value occurs.
+	"""
+
+	def __init__(self):
+		self.counts = collections.Counter()
+
+	def merge(self, other):
+		self.counts.update(other.counts)
+
+	def results(self):
+		return dict([(ustr(key), count) for key, count in self.counts.items()])
+
+	def ordered(self):
+		return sorted(self.counts.items(), key=lambda item: (-item[1], item[0]))
+
+	def format(self):
+		yield '{0}:'.format(self.title)
+		for key, count in self.ordered():
+			yield u'  {0: <24}{1}'.format(key, count)
+
+class PhonemeStatistics(CountStatistics):
+	title = 'Phonemes'
+
+	def add(self, word, context, phonemes, comment, meta, error):
+		if phonemes:
+			self.counts.update(phonemes)
+
+class StressStatistics(CountStatistics):
+	title = 'Stress patterns'
+
+	def add(self, word, context, phonemes, comment, meta, error):
+		if phonemes:
+			self.counts[''.join([p[-1] for p in phonemes if p[-1] in '012']) or '-'] += 1
+
+class LengthStatistics(CountStatistics):
+	title = 'Pronunciation lengths'
+
+	def add(self, word, context, phonemes, comment, meta, error):
+		if phonemes:
+			self.counts[len(phonemes)] += 1
+
+	def ordered(self):
+		return sorted(self.counts.items())
+
+class ContextStatistics(CountStatistics):
+	title = 'Contexts'
+
+	def add(self, word, context, phonemes, comment, meta, error):
+		if context:
+			self.counts[context] += 1
+
+class MetadataStatistics(CountStatistics):
+	title = 'Metadata keys'
+
+	def add(self, word, context, phonemes, comment, meta, error):
+		if meta and isinstance(meta, dict):
+			self.counts.update(meta.keys())
+
+class ErrorStatistics(CountStatistics):
+	title = 'Errors'
+
+	def add(self, word, context, phonemes, comment, meta, error):
+		if error:
+			self.counts[getattr(error, 'check', None) or 'error'] += 1
+
+statistics_types = {
+	'entries':  EntryStatistics,
+	'phonemes': PhonemeStatistics,
+	'stress':   StressStatistics,
+	'lengths':  LengthStatistics,
+	'contexts': ContextStatistics,
+	'metadata': MetadataStatistics,
+	'errors':   ErrorStatistics,
+}
+
+def create_statistics(names):
+	return [statistics_types[name]() for name in names]
+
+def collect_statistics(entries, statistics, error_output=None):
+	"""
+		Add the entries to each of the `statistics` in a single pass, printing
+		the errors to `error_output` if specified.
+	"""
+	for entry in entries:
+		if entry[5] and error_output:
+			print(entry[5], file=error_output)
+		for aggregator in statistics:
+			aggregator.add(*entry)
+	return statistics
+
+def merge_statistics(statistics, other):
+	for aggregator, other_aggregator in zip(statistics, other):
+		aggregator.merge(other_aggregator)
+	return statistics
+
+def collect_shard_statistics(task):
+	filename, names, kwargs = task
+	return collect_statistics(parse(filename, **kwargs), create_statistics(names), sys.stderr)
+
+def parallel_statistics(filenames, names, jobs=None, **kwargs):
+	"""
+		Collect the statistics for each dictionary (e.g. the shards in a shard
+		set) in `jobs` worker processes, merging the results. The keyword
+		arguments are passed to `parse`.
+	"""
+	statistics = create_statistics(names)
+	pool = multiprocessing.Pool(jobs)
+	try:
+		for result in pool.imap(collect_shard_statistics, [(filename, names, kwargs) for filename in filenames]):
+			merge_statistics(statistics, result)
+	finally:
+		pool.close()
+		pool.join()
+	return statistics
+
+shard_manifest_suffix = '.shards'
+
+def read_shard_manifest(filename):
+	"""
+		Read the shard filenames listed in a shard manifest. The shards are
+		relative to the directory containing the manifest.
+	"""
+	rootdir = os.path.dirname(filename)
+	with open(filename, 'rb') as f:
+		for line in f:
+			line = line.decode('utf-8').strip()
+			if line and not line.startswith('#'):
+				yield os.path.join(rootdir, line)
+
+def expand_shards(filenames):
+	shards = []
+	for filename in filenames:
+		if filename.endswith(shard_manifest_suffix):
+			shards.extend(read_shard_manifest(filename))
+		else:
+			shards.append(filename)
+	return shards
+
+def shard_letter(word):
+	letter = word[0].upper()
+	if 'A' <= letter <= 'Z' or '0' <= letter <= '9':
+		return letter
+	return '_'
+
+def split_dictionary(filename, directory, shard_size=None, encoding='windows-1252'):
+	"""
+		Split the dictionary into shards in `directory`, returning the name of
+		the shard manifest file listing the shards in order.
+
+		The dictionary is split by the initial letter of the words, or into
+		shards of about `shard_size` entries if specified. The entries for a
+		word are kept in the same shard. The file-level comments and metadata
+		before the first entry are written to every shard.
+	"""
+	if filename == '-' or not is_filename(filename):
+		stem, ext = 'cmudict', ''
+	else:
+		stem, ext = os.path.splitext(os.path.basename(strip_compression_suffix(filename)))
+	if not os.path.exists(directory):
+		os.makedirs(directory)
+
+	dict_parser, lines = setup_dict_parser(filename)
+	header = None
+	pending = []
+	shards = []
+	files = {}
+	current = None
+	previous_word = None
+	entries = 0
+	try:
+		for line in lines:
+			fields = entry_fields(line, dict_parser, encoding)
+			if not fields:
+				if header is None:
+					meta = line_metadata(line, encoding)
+					if meta and 'encoding' in meta.keys():
+						encoding = meta['encoding'][0]
+				pending.append(line)
+				continue
+			if header is None:
+				header = pending
+				pending = []
+			word = fields[0]
+			if shard_size:
+				if current is None or (entries >= shard_size and word != previous_word):
+					current = '{0:04d}'.format(len(shards) + 1)
+					entries = 0
+				entries = entries + 1
+			else:
+				current = shard_letter(word)
+			previous_word = word
+			if current not in files:
+				name = '{0}-{1}{2}'.format(stem, current, ext)
+				shards.append(name)
+				files[current] = open(os.path.join(directory, name), 'wb')
+				for header_line in header:
+					files[current].write(header_line + b'\n')
+			f = files[current]
+			for pending_line in pending:
+				f.write(pending_line + b'\n')
+			f.write(line + b'\n')
+			pending = []
+		if current is not None:
+			for pending_line in pending:
+				files[current].write(pending_line + b'\n')
+	finally:
+		for f in files.values():
+			f.close()
+
+	manifest = os.path.join(directory, '{0}{1}'.format(stem, shard_manifest_suffix))
+	with open(manifest, 'wb') as f:
+		for name in shards:
+			f.write(name.encode('utf-8') + b'\n')
+	return manifest
+
+def join_lines(shards, encoding='windows-1252', sort_mode=None):
+	"""
+		Join the dictionary shards (or shard manifests), returning the lines
+		of the combined dictionary.
+
+		The file-level comments and metadata are taken from the first shard.
+		If the entries are sorted, using `sort_mode` or the `sorting` file
+		metadata, the shards are merged in that order so the entries at the
+		shard boundaries are correctly ordered. Otherwise, the shards are
+		joined in the order given.
+	"""
+	shards = expand_shards(shards)
+	if not shards:
+		return
+	dict_parser, _ = setup_dict_parser(shards[0])
+
+	streams = []
+	for index, shard in enumerate(shards):
+		lines = read_file(shard)
+		header = []
+		for line in lines:
+			fields = entry_fields(line, dict_parser, encoding)
+			if not fields:
+				header.append(line)
+				continue
+			if index == 0:
+				for header_line in header:
+					meta = line_metadata(header_line, encoding)
+					if meta and not sort_mode and 'sorting' in meta.keys():
+						sort_mode = meta['sorting'][0]
+					if meta and 'encoding' in meta.keys():
+						encoding = meta['encoding'][0]
+					yield header_line
+			streams.append(itertools.chain([line], lines))
+			break
+		else:
+			if index == 0:
+				for header_line in header:
+					yield header_line
+
+	if not sort_mode:
+		for lines in streams:
+			for line in lines:
+				yield line
+		return
+
+	sort_key = create_sort_key(sort_mode)
+	def entries(index, lines):
+		pending = []
+		for seq, line in enumerate(lines):
+			pending.append(line)
+			fields = entry_fields(line, dict_parser, encoding)
+			if fields:
+				yield (0, sort_key(sort_keyword(fields[0], fields[1], sort_mode)), index, seq, pending)
+				pending = []
+		if pending:
+			yield (1, index, pending)
+
+	for item in heapq.merge(*[entries(index, lines) for index, lines in enumerate(streams)]):
+		for line in item[-1]:
+			yield line
+
+def join(shards, encoding='windows-1252', sort_mode=None):
+	output = stdout()
+	for line in join_lines(shards, encoding, sort_mode):
+		output.write(line + b'\n')
+
+re_word_token = re.compile(r"[^\W\d_]+(?:'[^\W\d_]+)*", re.UNICODE)
+
+class Coverage:
+	"""
+		The token and type coverage of a set of corpora.
+	"""
+
+	def __init__(self):
+		self.tokens = 0
+		self.covered_tokens = 0
+		self.covered_types = set()
+		self.oov = collections.Counter()
+		self.bytes = 0
+		self.elapsed = 0
+
+	@property
+	def types(self):
+		return len(self.covered_types) + len(self.oov)
+
+	def add(self, chunk_size, tokens, covered_tokens, covered_types, oov):
+		self.bytes = self.bytes + chunk_size
+		self.tokens = self.tokens + tokens
+		self.covered_tokens = self.covered_tokens + covered_tokens
+		self.covered_types.update(covered_types)
+		self.oov.update(oov)
+
+	def top_oov(self, count):
+		return sorted(self.oov.items(), key=lambda item: (-item[1], item[0]))[:count]
+
+	def throughput(self):
+		"""
+			The throughput in GB of text per minute.
+		"""
+		if not self.elapsed:
+			return 0.0
+		return (self.bytes / 1e9) / (self.elapsed / 60.0)
+
+def count_coverage(chunk, words, normalize, encoding='utf-8'):
+	counts = collections.Counter()
+	for token, count in collections.Counter(re_word_token.findall(chunk.decode(encoding, 'replace'))).items():
+		counts[normalize(token)] += count
+	covered_tokens = 0
+	covered_types = []
+	oov = {}
+	for word, count in counts.items():
+		if word in words:
+			covered_tokens = covered_tokens + count
+			covered_types.append(word)
+		else:
+			oov[word] = count
+	return len(chunk), sum(counts.values()), covered_tokens, covered_types, oov
+
+coverage_worker = {}
+
+def init_coverage_worker(words, dict_format, encoding):
+	coverage_worker['words'] = WordList(words)
+	coverage_worker['normalize'] = dict_formats[dict_format]['word']
+	coverage_worker['encoding'] = encoding
+
+def count_coverage_worker(chunk):
+	return count_coverage(chunk, coverage_worker['words'], coverage_worker['normalize'], coverage_worker['encoding'])
+
+def read_corpus_chunks(filename, chunk_size):
+	"""
+		Read the corpus in chunks of about `chunk_size` bytes, ending each chunk
+		at the end of a line.
+	"""
+	if filename == '-':
+		f = decompress_stream(stdin())
+	else:
+		f = open_file(filename, 'rb')
+	try:
+		while True:
+			chunk = f.read(chunk_size)
+			if not chunk:
+				break
+			yield chunk + f.readline()
+	finally:
+		if filename != '-':
+			f.close()
+
+def corpus_coverage(words, corpora, dict_format='cmudict', jobs=None, chunk_size=4194304, encoding='utf-8'):
+	"""
+		Calculate how many of the words in the text `corpora` are in the
+		dictionary `words` WordList.
+
+		The corpora are read in chunks that are tokenized and looked up in
+		`jobs` worker processes, or in this process if `jobs` is 1. The words
+		are normalized using the `dict_format` word casing.
+	"""
+	coverage = Coverage()
+	start = time.time()
+	chunks = itertools.chain.from_iterable([read_corpus_chunks(corpus, chunk_size) for corpus in corpora])
+	if jobs == 1:
+		normalize = dict_formats[dict_format]['word']
+		for chunk in chunks:
+			coverage.add(*count_coverage(chunk, words, normalize, encoding))
+	else:
+		data = words.data[words.offset:words.offset + words.size]
+		pool = multiprocessing.Pool(jobs, init_coverage_worker, (data, dict_format, encoding))
+		try:
+			for result in pool.imap_unordered(count_coverage_worker, chunks):
+				coverage.add(*result)
+		finally:
+			pool.close()
+			pool.join()
+	coverage.elapsed = time.time() - start
+	return coverage
+
+def entry_digest(text):
+	"""
+		A fixed-size digest of an entry used by the duplicate checks.
+	"""
+	return hashlib.md5(text.encode('utf-8')).digest()[:8]
+
+def parse(filename, warnings=[], order_from=0, accent=None, phoneset=None, encoding='windows-1252', syllable_breaks=True, sort_mode=None, context=None):
+	"""
+		Parse and validate the entries in the `filename` dictionary.
+
+		The entries are yielded as (word, context, phonemes, comment, metadata,
+		error) tuples. The `context` is the ParserContext to use for the parse
+		state, or None to create a new one.
+	"""
+	if is_sqlite_database(filename):
+		for entry in read_sqlite(filename):
+			yield entry
+		return
 
-def parse(filename, warnings=[], order_from=0, accent=None, phoneset=None, encoding='windows-1252', syllable_breaks=True, sort_mode=None):
 	checks = warnings_to_checks(warnings)
+	parser_context = context or ParserContext()
+	parser_context.filename = filename
+	parser_context.checks = checks
+	parser_context.encoding = encoding
+	passthrough = parser_context.passthrough
 	previous_word = None
 	re_word = None
 	context_parser = None
 	phonemeset = None
-	entries = Trie()
-	lines = Trie()
+	positions = {}
+	lines = set()
+	pronunciations = set()
+	window = []
+	window_state = {}
+	windowed = None
+	evicted = None
+	track_lines = 'duplicate-entries' in checks
+	track_pronunciations = 'duplicate-pronunciations' in checks
+	track_entries = track_lines or track_pronunciations or 'context-ordering' in checks
 	fmt = None
 
+	parse_error = parser_context.error
+
 	dict_parser, dict_lines = setup_dict_parser(filename)
 	sort_key = create_sort_key(sort_mode)
-	for line, format, word, context, phonemes, comment, meta, error in dict_parser(dict_lines, checks, encoding):
+	for line, format, word, context, phonemes, comment, meta, error in dict_parser(parser_context.count_lines(dict_lines), checks, encoding, parser_context):
 		if error:
+			error.line_number = parser_context.line_number
 			yield None, None, None, None, None, error
 			continue
 
 		if not word: # line comment or blank line
+			if passthrough and meta is None and fmt:
+				parser_context.keep_line(fmt, line, None, None, None, comment)
 			yield None, None, None, comment, meta, None
 			if meta and not fmt:
 				if 'accent' in meta.keys():
@@ -978,12 +3345,13 @@ def parse(filename, warnings=[], order_from=0, accent=None, phoneset=None, encod
 					phoneset = meta['phoneset'][0]
 				if 'sorting' in meta.keys():
 					sort_key = create_sort_key(meta['sorting'][0])
+					windowed = meta['sorting'][0]
 				if 'context-format' in meta.keys():
 					entry = meta['context-format'][0]
 					if entry.startswith('@'):
 						context_parser = TypeValidator(entry[1:])
 					else:
-						path = os.path.join(os.path.dirname(filename), entry)
+						path = os.path.join(parser_context.rootdir(), entry)
 						if not os.path.exists(path):
 							path = os.path.join(root, 'pos-tags', '{0}.ttl'.format(entry))
 						context_parser = TagsetValidator(path)
@@ -998,21 +3366,24 @@ def parse(filename, warnings=[], order_from=0, accent=None, phoneset=None, encod
 			phonemeset = load_phonemes(accent, phoneset)
 			if not context_parser:
 				context_parser = fmt['context-parser']
+			parser_context.format = format
+			parser_context.phonemeset = phonemeset
 
 		# word validation checks
 
 		if is_check_enabled('word-casing', checks, meta) and fmt['word'](word) != word:
-			yield None, None, None, None, None, u'Incorrect word casing in entry: "{0}"'.format(line)
+			yield None, None, None, None, None, parse_error('word-casing', u'Incorrect word casing in entry: "{0}"', line)
 
 		if is_check_enabled('unsorted', checks, meta) and previous_word and sort_key(word) < sort_key(previous_word):
-			yield None, None, None, None, None, u'Incorrect word ordering ("{0}" < "{1}") for entry: "{2}"'.format(word, previous_word, line)
+			yield None, None, None, None, None, parse_error('unsorted', u'Incorrect word ordering ("{0}" < "{1}") for entry: "{2}"', word, previous_word, line)
 
 		# context parsing and validation checks
 
+		raw_context = context
 		if context is not None:
 			isvalid, context = context_parser(context)
 			if is_check_enabled('context-values', checks, meta) and not isvalid:
-				yield None, None, None, None, None, u'Invalid context format "{0}" in entry: "{1}"'.format(context, line)
+				yield None, None, None, None, None, parse_error('context-values', u'Invalid context format "{0}" in entry: "{1}"', context, line)
 
 		# phoneme validation checks
 
@@ -1020,7 +3391,7 @@ def parse(filename, warnings=[], order_from=0, accent=None, phoneset=None, encod
 		stress_counts = dict([(t, 0) for t in StressType.types()])
 		for phoneme, error in phonemeset.parse(phonemes, checks, meta):
 			if error:
-				yield None, None, None, None, None, u'{0} in entry: "{1}"'.format(error, line)
+				yield None, None, None, None, None, parse_error(error.check, u'{0} in entry: "{1}"', error, line)
 			else:
 				if syllable_breaks == False and 'syllable' in phonemeset.types(phoneme):
 					continue
@@ -1038,39 +3409,66 @@ def parse(filename, warnings=[], order_from=0, accent=None, phoneset=None, encod
 			pass
 		elif stress_counts[StressType.PRIMARY_STRESS] == 0:
 			if is_check_enabled('missing-primary-stress', checks, meta):
-				yield None, None, None, None, None, u'No primary stress marker in entry: "{0}"'.format(line)
+				yield None, None, None, None, None, parse_error('missing-primary-stress', u'No primary stress marker in entry: "{0}"', line)
 		elif stress_counts[StressType.PRIMARY_STRESS] != 1:
 			if is_check_enabled('multiple-primary-stress', checks, meta):
-				yield None, None, None, None, None, u'Multiple primary stress markers in entry: "{0}"'.format(line)
+				yield None, None, None, None, None, parse_error('multiple-primary-stress', u'Multiple primary stress markers in entry: "{0}"', line)
 
 		# duplicate and context ordering checks
 
-		keyword = word.upper()
-		position = order_from if context is None else context
-
-		entry_line = u'{0}({1}) {2}'.format(word, context, arpabet_phonemes)
-		if is_check_enabled('duplicate-entries', checks, meta) and entry_line in lines:
-			yield None, None, None, None, None, u'Duplicate entry: "{2}"'.format(position, expect_position, line)
-		elif isinstance(position, int):
-			pronunciation = ' '.join(arpabet_phonemes)
-			if keyword in entries:
-				expect_position, pronunciations = entries[keyword]
-			else:
-				expect_position = order_from
-				pronunciations = []
-			if is_check_enabled('context-ordering', checks, meta) and position != expect_position:
-				yield None, None, None, None, None, u'Incorrect context ordering "{0}" (expected: "{1}") in entry: "{2}"'.format(position, expect_position, line)
-			expect_position = expect_position + 1
-			if is_check_enabled('duplicate-pronunciations', checks, meta):
-				if pronunciation in pronunciations:
-					yield None, None, None, None, None, u'Existing pronunciation in entry: "{2}"'.format(position, expect_position, line)
+		if track_entries:
+			keyword = word.upper()
+			entry_lines = lines
+			entry_pronunciations = pronunciations
+			if windowed: # only keep the state for the current word group
+				while window and not keyword.startswith(window[-1]):
+					previous = window.pop()
+					positions.pop(previous, None)
+					del window_state[previous]
+					if not evicted or sort_key(previous) > sort_key(evicted):
+						evicted = previous
+				if window and window[-1] == keyword:
+					entry_lines, entry_pronunciations = window_state[keyword]
+				elif evicted and sort_key(keyword) <= sort_key(evicted) and (keyword == evicted or not evicted.startswith(keyword)):
+					# the dictionary is not in the declared order, so check the rest of the entries against each other
+					if is_check_enabled('unsorted', checks, meta):
+						yield None, None, None, None, None, parse_error('unsorted', u'Entry not in the "{0}" sorting order, checking duplicates from this entry: "{1}"', windowed, line)
+					for previous_lines, previous_pronunciations in window_state.values():
+						lines.update(previous_lines)
+						pronunciations.update(previous_pronunciations)
+					window_state.clear()
+					windowed = None
 				else:
-					pronunciations.append(pronunciation)
-			entries[keyword] = (expect_position, pronunciations)
+					window.append(keyword)
+					entry_lines, entry_pronunciations = window_state[keyword] = (set(), set())
+
+			position = order_from if context is None else context
+			if track_lines:
+				entry_line = entry_digest(u'{0}({1}) {2}'.format(word, context, ' '.join(arpabet_phonemes)))
+			if track_lines and is_check_enabled('duplicate-entries', checks, meta) and entry_line in entry_lines:
+				yield None, None, None, None, None, parse_error('duplicate-entries', u'Duplicate entry: "{0}"', line)
+			elif isinstance(position, int):
+				expect_position = positions.get(keyword, order_from)
+				if is_check_enabled('context-ordering', checks, meta) and position != expect_position:
+					yield None, None, None, None, None, parse_error('context-ordering', u'Incorrect context ordering "{0}" (expected: "{1}") in entry: "{2}"', position, expect_position, line)
+				positions[keyword] = expect_position + 1
+				if track_pronunciations and is_check_enabled('duplicate-pronunciations', checks, meta):
+					pronunciation = entry_digest(u'{0} {1}'.format(keyword, ' '.join(arpabet_phonemes)))
+					if pronunciation in entry_pronunciations:
+						yield None, None, None, None, None, parse_error('duplicate-pronunciations', u'Existing pronunciation in entry: "{0}"', line)
+					else:
+						entry_pronunciations.add(pronunciation)
+			if track_lines:
+				entry_lines.add(entry_line)
 
-		lines[entry_line] = True
 		previous_word = word
 
+		if passthrough and meta is None and (context is None or ustr(context) == raw_context):
+			if phonemes == phonemeset.separator.join(arpabet_phonemes) and phonemeset.unchanged_phonemes().issuperset(arpabet_phonemes):
+				parser_context.keep_line(fmt, line, word, context, phonemes, comment)
+
 		# return the parsed entry
 
 		yield word, context, arpabet_phonemes, comment, meta, None
+
+	memory_checkpoint('parse')
@@ -30,8 +30,77 @@ import subprocess
 
 import rdflib
 
+if sys.version_info[0] == 2:
+	string_types = (str, unicode)
+else:
+	string_types = (str,)
+
 dict_formats = {}
 
+##### Metadata Cache ##########################################################
+
+class FrozenMetadata(dict):
+	"""
+		A metadata mapping that cannot be modified. This allows the parsed
+		metadata to be shared between entries with the same metastring.
+	"""
+
+	def __immutable(self, *args, **kwargs):
+		raise TypeError('FrozenMetadata objects cannot be modified')
+
+	__setitem__ = __delitem__ = __immutable
+	clear = pop = popitem = setdefault = update = __immutable
+
+	def __hash__(self):
+		try:
+			return self._hash
+		except AttributeError:
+			self._hash = hash(frozenset(self.items()))
+			return self._hash
+
+	def __reduce__(self):
+		return (FrozenMetadata, (dict(self),))
+
+def freeze(value):
+	if isinstance(value, dict):
+		return FrozenMetadata([(k, freeze(v)) for k, v in value.items()])
+	if isinstance(value, list):
+		return tuple([freeze(v) for v in value])
+	return value
+
+def cached(parser, maxsize=4096):
+	"""
+		Cache the (metadata, errors) result of a metadata parser by the
+		metastring and validators. The metadata is returned as an immutable
+		FrozenMetadata object, with the lists converted to tuples.
+
+		The validators should be passed as a FrozenMetadata object, as they
+		are then used in the cache key as is. Other mappings are converted to
+		a sorted tuple on each call.
+
+		The cache is cleared when it has `maxsize` items. The dict operations
+		used are atomic, so the cache can be shared between threads.
+	"""
+	cache = {}
+	def parse(data, values=None):
+		if values is None or isinstance(values, FrozenMetadata):
+			key = (data, values)
+		else:
+			key = (data, tuple(sorted(values.items())))
+		ret = cache.get(key)
+		if ret is None:
+			meta, errors = parser(data, values)
+			ret = (freeze(meta), tuple(errors))
+			if len(cache) >= maxsize:
+				cache.clear()
+			cache[key] = ret
+		return ret
+	parse.__name__ = parser.__name__
+	parse.__doc__ = parser.__doc__
+	parse.cache = cache
+	parse.uncached = parser
+	return parse
+
 ##### CSV Parser ##############################################################
 
 if sys.version_info[0] == 2:
@@ -58,6 +127,7 @@ def parse_csv(filename):
 
 ##### JSON Parser #############################################################
 
+@cached
 def parse_json(meta, values=None):
 	try:
 		return json.loads(meta), []
@@ -68,9 +138,11 @@ dict_formats['json'] = (parse_json, json.dumps)
 
 ##### Key-Value Metadata Parser ###############################################
 
+re_key   = re.compile(r'^[a-zA-Z0-9_\-]+$')
+re_value = re.compile(r'^[^\x00-\x20\x7F-\xFF"]+$')
+
+@cached
 def parse_key_values(data, values=None):
-	re_key   = re.compile(r'^[a-zA-Z0-9_\-]+$')
-	re_value = re.compile(r'^[^\x00-\x20\x7F-\xFF"]+$')
 	errors = []
 	meta = {}
 	for key, value in [x.split('=') for x in data.strip().split()]:
@@ -96,7 +168,7 @@ def parse_key_values(data, values=None):
 def format_key_values(meta):
 	ret = []
 	for key, values in sorted(meta.items()):
-		if isinstance(values, (str, unicode)):
+		if isinstance(values, string_types):
 			ret.append(u'{0}={1}'.format(key, values))
 		else:
 			ret.extend([u'{0}={1}'.format(key, value) for value in values])
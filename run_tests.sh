@@ -35,7 +35,35 @@ check() {
 	echo >> ${LOG_FILE}
 
 	echo -n "testing ${MESSAGE} ... " | tee -a ${LOG_FILE}
-	${PYTHON} ./cmudict-tools $@ 2>&1 | tee > ${RES_FILE}
+	${PYTHON} ./cmudict-tools "$@" 2>&1 | tee > ${RES_FILE}
+	diff ${OUT_FILE} ${RES_FILE} > /dev/null
+	if [[ $? -eq 0 ]] ; then
+		echo "pass" | tee -a ${LOG_FILE}
+	else
+		echo "fail" | tee -a ${LOG_FILE}
+		echo "<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<" >> ${LOG_FILE}
+		diff -U0 ${OUT_FILE} ${RES_FILE} >> ${LOG_FILE}
+		echo ">>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>" >> ${LOG_FILE}
+	fi
+}
+
+check_stdin() {
+	MESSAGE=$1
+	OUT_FILE=$2
+	SRC_FILE=$3
+	shift
+	shift
+	shift
+
+	RES_FILE=/tmp/cmudict_tools_test.out
+
+	echo "-------------------------------------------------------------------------------" >> ${LOG_FILE}
+	echo "command  : ./cmudict-tools $@ < ${SRC_FILE}" >> ${LOG_FILE}
+	echo "expected : ${OUT_FILE}" >> ${LOG_FILE}
+	echo >> ${LOG_FILE}
+
+	echo -n "testing ${MESSAGE} ... " | tee -a ${LOG_FILE}
+	cat ${SRC_FILE} | ${PYTHON} ./cmudict-tools "$@" 2>&1 | tee > ${RES_FILE}
 	diff ${OUT_FILE} ${RES_FILE} > /dev/null
 	if [[ $? -eq 0 ]] ; then
 		echo "pass" | tee -a ${LOG_FILE}
@@ -72,6 +100,53 @@ check_metadata() {
 	fi
 }
 
+check_script() {
+	MESSAGE=$1
+	OUT_FILE=$2
+	SRC_FILE=$3
+
+	RES_FILE=/tmp/cmudict_tools_test.out
+
+	echo "-------------------------------------------------------------------------------" >> ${LOG_FILE}
+	echo "command  : ${SRC_FILE}" >> ${LOG_FILE}
+	echo "expected : ${OUT_FILE}" >> ${LOG_FILE}
+	echo >> ${LOG_FILE}
+
+	echo -n "testing ${MESSAGE} ... " | tee -a ${LOG_FILE}
+	${PYTHON} ${SRC_FILE} 2>&1 | tee > ${RES_FILE}
+	diff ${OUT_FILE} ${RES_FILE} > /dev/null
+	if [[ $? -eq 0 ]] ; then
+		echo "pass" | tee -a ${LOG_FILE}
+	else
+		echo "fail" | tee -a ${LOG_FILE}
+		echo "<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<" >> ${LOG_FILE}
+		diff -U0 ${OUT_FILE} ${RES_FILE} >> ${LOG_FILE}
+		echo ">>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>" >> ${LOG_FILE}
+	fi
+}
+
+check_file() {
+	MESSAGE=$1
+	OUT_FILE=$2
+	RES_FILE=$3
+
+	echo "-------------------------------------------------------------------------------" >> ${LOG_FILE}
+	echo "file     : ${RES_FILE}" >> ${LOG_FILE}
+	echo "expected : ${OUT_FILE}" >> ${LOG_FILE}
+	echo >> ${LOG_FILE}
+
+	echo -n "testing ${MESSAGE} ... " | tee -a ${LOG_FILE}
+	diff ${OUT_FILE} ${RES_FILE} > /dev/null
+	if [[ $? -eq 0 ]] ; then
+		echo "pass" | tee -a ${LOG_FILE}
+	else
+		echo "fail" | tee -a ${LOG_FILE}
+		echo "<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<" >> ${LOG_FILE}
+		diff -U0 ${OUT_FILE} ${RES_FILE} >> ${LOG_FILE}
+		echo ">>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>" >> ${LOG_FILE}
+	fi
+}
+
 # Metadata Description Parser Tests ###########################################
 
 check_metadata "csv metadata parsing" tests/metadata.json tests/metadata.csv
@@ -104,6 +179,16 @@ check "cmudict-weide format parsing; Windows line endings" tests/cmudict-weide.j
 check "cmudict-new format parsing; Windows line endings"   tests/cmudict-new.json   ${ARGS} tests/cmudict-new-crlf
 check "festlex format parsing; Windows line endings"       tests/festlex.json       ${ARGS} tests/festlex-crlf.scm
 
+check_stdin "cmudict format parsing; stdin"       tests/cmudict.json       tests/cmudict       ${ARGS} -
+check_stdin "cmudict-weide format parsing; stdin" tests/cmudict-weide.json tests/cmudict-weide ${ARGS} -
+check_stdin "cmudict-new format parsing; stdin"   tests/cmudict-new.json   tests/cmudict-new   ${ARGS} -
+check_stdin "festlex format parsing; stdin"       tests/festlex.json       tests/festlex.scm   ${ARGS} -
+
+check "cmudict format parsing; bzip2 compressed"       tests/cmudict.json       ${ARGS} tests/cmudict.bz2
+check "cmudict-weide format parsing; xz compressed"    tests/cmudict-weide.json ${ARGS} tests/cmudict-weide.xz
+check "festlex format parsing; gzip compressed"        tests/festlex.json       ${ARGS} tests/festlex.scm.gz
+check_stdin "festlex format parsing; gzip compressed stdin" tests/festlex.json tests/festlex.scm.gz ${ARGS} -
+
 ARGS="print -Wall -Wno-unsorted --format=cmudict"
 check "cmudict format parsing; utf-8 in, utf-8 out" tests/encoding.utf-8 ${ARGS} --input-encoding=utf-8 --output-encoding=utf-8 tests/encoding.utf-8
 check "cmudict format parsing; utf-8 in, latin1 out" tests/encoding.latin1 ${ARGS} --input-encoding=utf-8 --output-encoding=latin1 tests/encoding.utf-8
@@ -119,6 +204,8 @@ check "cmudict format parsing; encoding=latin1 metadata" tests/encoding.latin1.m
 
 ARGS="print -Wall -Wno-unsorted --format=json"
 check "file metadata format key" tests/filemeta-format.json ${ARGS} tests/filemeta-format
+check "file metadata metadata key" tests/filemeta-metadata.json ${ARGS} tests/filemeta-metadata
+check "file metadata metadata key after entries" tests/filemeta-metadata-after.json ${ARGS} tests/filemeta-metadata-after
 
 # Formatter Tests #############################################################
 
@@ -128,6 +215,8 @@ check "cmudict-weide formatting" tests/format-cmudict-weide ${ARGS} --format=cmu
 check "cmudict-new formatting" tests/format-cmudict-new ${ARGS} --format=cmudict-new tests/format-cmudict
 check "sphinx formatting" tests/format-sphinx ${ARGS} --format=sphinx tests/format-cmudict
 check "festlex formatting" tests/format-festlex.scm ${ARGS} --format=festlex tests/format-cmudict
+check "festlex-compiled formatting" tests/festlex-compiled.out ${ARGS} --format=festlex-compiled tests/festlex-compiled.dict
+check "cmudict formatting; unchanged lines" tests/passthrough.out print -Wnone tests/passthrough
 
 # Sorting Tests ###############################################################
 
@@ -167,6 +256,18 @@ check "accents/en-GB-x-rp.csv accent, arpabet phones" tests/phone_en-GB-x-rp-arp
 ARGS="print -Wnone --format=json"
 check "-Wnone" tests/phone_en-US-x-cmu_Wnone.json ${ARGS} tests/phone_arpabet.upper
 
+# Error Reporting Tests #######################################################
+
+check "--summary" tests/validate-summary validate -Wall --summary tests/cmudict
+check "--max-errors" tests/validate-max-errors validate -Wall --max-errors 3 tests/cmudict
+check "--max-errors with --summary" tests/validate-max-errors-summary validate -Wall --max-errors 3 --summary tests/cmudict
+check "--max-errors with print" tests/print-max-errors -Wall --max-errors 1 print tests/cmudict
+check "--summary without parsing" tests/delta --summary delta tests/delta-base tests/delta-target
+check "duplicate and context checks; sorted input" tests/sorted-checks.out validate -Wall -Wno-unsorted tests/sorted-checks
+check "duplicate and context checks; unsorted input" tests/sorted-checks-unsorted.out validate -Wall -Wno-unsorted tests/sorted-checks-unsorted
+check "duplicate checks; unsorted input, unsorted enabled" tests/sorted-checks-fallback.out validate -Wall tests/sorted-checks-fallback
+check "duplicate checks; unsorted input, unsorted disabled" tests/sorted-checks-fallback.nowarn validate -Wnone -Wduplicate-entries tests/sorted-checks-fallback
+
 # Manipulation Tests ##########################################################
 
 ARGS="print -Wnone --source-phoneset=arpabet"
@@ -174,6 +275,96 @@ check "--remove-context-entries" tests/no_context ${ARGS} --format=sphinx --remo
 check "--remove-syllable-breaks" tests/phone_arpabet.no_syllable_breaks ${ARGS} --remove-syllable-breaks tests/phone_arpabet.upper
 check "--remove-stress" tests/no_stress ${ARGS} --remove-stress tests/no_stress.dict
 
+# Delta Tests #################################################################
+
+check "delta" tests/delta delta tests/delta-base tests/delta-target
+check "patch" tests/delta-target patch tests/delta-base tests/delta
+check "patch: missing entry" tests/patch-missing patch tests/delta-base tests/delta-missing
+check "patch: invalid entries" tests/patch-invalid -Wall patch tests/delta-base tests/delta-invalid
+check "delta: duplicate base entries" tests/delta-duplicates.out delta tests/delta-duplicates tests/delta-base
+check "insert" tests/insert insert tests/delta-base tests/insert-entries
+check "insert: word case" tests/insert-lowercase.out insert tests/insert-weide tests/insert-lowercase
+
+# Merge Tests #################################################################
+
+check "merge conflict markers" tests/merge-conflicts.merge merge tests/merge-conflicts
+check "diff conflict markers" tests/merge-conflicts.diff diff tests/merge-conflicts
+
+# Export Tests ################################################################
+
+rm -f /tmp/cmudict_tools_test.db
+check "sqlite export" tests/export-sqlite --format sqlite export=/tmp/cmudict_tools_test.db tests/delta-base
+check "sqlite import" tests/delta-base print /tmp/cmudict_tools_test.db
+rm -f /tmp/cmudict_tools_test.db
+
+rm -rf /tmp/cmudict_tools_kaldi
+check "kaldi export" tests/export-kaldi --format kaldi export=/tmp/cmudict_tools_kaldi tests/delta-base
+check_file "kaldi export: phones" tests/export-kaldi.phones /tmp/cmudict_tools_kaldi/phones.txt
+check_file "kaldi export: nonsilence phones" tests/export-kaldi.nonsilence /tmp/cmudict_tools_kaldi/nonsilence_phones.txt
+check_file "kaldi export: silence phones" tests/export-kaldi.silence /tmp/cmudict_tools_kaldi/silence_phones.txt
+check_file "kaldi export: optional silence" tests/export-kaldi.silence /tmp/cmudict_tools_kaldi/optional_silence.txt
+check_file "kaldi export: words" tests/export-kaldi.words /tmp/cmudict_tools_kaldi/words.txt
+check_file "kaldi export: lexicon" tests/export-kaldi.lexicon /tmp/cmudict_tools_kaldi/lexicon.txt
+check_file "kaldi export: integer lexicon" tests/export-kaldi.int /tmp/cmudict_tools_kaldi/lexicon.int
+check_file "kaldi export: binary lexicon" tests/export-kaldi.bin /tmp/cmudict_tools_kaldi/lexicon.bin
+rm -rf /tmp/cmudict_tools_kaldi
+check "kaldi export: position dependent phones" tests/export-kaldi --format kaldi --position-dependent-phones --remove-stress export=/tmp/cmudict_tools_kaldi tests/delta-base
+check_file "kaldi export: position dependent phones" tests/export-kaldi-position.phones /tmp/cmudict_tools_kaldi/phones.txt
+check_file "kaldi export: position dependent nonsilence phones" tests/export-kaldi-position.nonsilence /tmp/cmudict_tools_kaldi/nonsilence_phones.txt
+check_file "kaldi export: position dependent lexicon" tests/export-kaldi-position.lexicon /tmp/cmudict_tools_kaldi/lexicon.txt
+check_file "kaldi export: position dependent integer lexicon" tests/export-kaldi-position.int /tmp/cmudict_tools_kaldi/lexicon.int
+rm -rf /tmp/cmudict_tools_kaldi
+check "kaldi export: syllable breaks and unknown phonemes" tests/export-kaldi-syllables --format kaldi --source-phoneset arpabet -Wnone export=/tmp/cmudict_tools_kaldi tests/export-kaldi-syllables.dict
+check_file "kaldi export: syllable breaks lexicon" tests/export-kaldi-syllables.lexicon /tmp/cmudict_tools_kaldi/lexicon.txt
+rm -rf /tmp/cmudict_tools_kaldi
+
+# Shard Tests #################################################################
+
+rm -rf /tmp/cmudict_tools_shards
+check "split" tests/split --shard-size 2 split=/tmp/cmudict_tools_shards tests/delta-base
+check "shard set as a dictionary" tests/delta-base print /tmp/cmudict_tools_shards/delta-base.shards
+check "join" tests/shard-joined join tests/shard-1 tests/shard-2
+rm -rf /tmp/cmudict_tools_shards
+
+# Coverage Tests ##############################################################
+
+check "coverage" tests/coverage --jobs 2 --top-oov 5 coverage tests/delta-base tests/corpus.txt
+
+# Statistics Tests ############################################################
+
+check "stats" tests/stats -Wnone stats=all tests/delta-base
+check "stats (json)" tests/stats.json -Wnone --format json stats=entries,lengths,stress tests/delta-base
+
+# Concurrency Tests ###########################################################
+
+check_script "concurrent parsing" tests/concurrent-parse tests/concurrent-parse.py
+check_script "asynchronous parsing" tests/aio-parse tests/aio-parse.py
+check_script "sharded index freshness" tests/shard-index tests/shard-index.py
+
+# Transliteration Tests #######################################################
+
+check_script "transliterate" tests/transliterate tests/transliterate.py
+
+# Pronunciation Index Tests ###################################################
+
+ARGS="-Wnone"
+check "homophones" tests/homophones ${ARGS} homophones=READ tests/pronunciation-index
+check "rhymes" tests/rhymes ${ARGS} rhymes=READ tests/pronunciation-index
+check "prefix" tests/prefix ${ARGS} prefix=RE tests/pronunciation-index
+check "lookup" tests/lookup ${ARGS} lookup=read tests/pronunciation-index
+check "match: phonemes" tests/match-suffix ${ARGS} "match=* AH0 N" tests/phoneme-patterns
+check "match: wildcards" tests/match-wildcard ${ARGS} "match=* *1 ZH *" tests/phoneme-patterns
+check "match: regex" tests/match-regex ${ARGS} "match=/SH AH0/" tests/phoneme-patterns
+
+# Select Tests ################################################################
+
+ARGS="-Wnone"
+check "select: metadata or word" tests/select-or ${ARGS} "select=@stem|word" tests/select
+check "select: where" tests/select-where ${ARGS} "select=word,count where count>=5" tests/select
+check "select: conditions" tests/select-conditions ${ARGS} "select=word where @pos=VBG or (count<4 and word~^R)" tests/select
+check "select: invalid number" tests/select-invalid-number ${ARGS} "select=word where count<abc" tests/select
+check "select: invalid regex" tests/select-invalid-regex ${ARGS} "select=word where word~\"(\"" tests/select
+
 # Print Tests #################################################################
 
 ARGS="print -Wnone --source-phoneset=arpabet --accent=en-US"
@@ -188,6 +379,18 @@ ARGS="print -Wnone --source-phoneset=arpabet"
 check "printing default accent, arpabet phones" tests/phone_arpabet.upper ${ARGS} --phoneset=arpabet tests/phone_arpabet.upper
 check "printing default accent, festvox phones" tests/phone_festvox.lower ${ARGS} --phoneset=festvox tests/phone_arpabet.upper
 check "printing default accent, cepstral phones" tests/phone_en-US-x-cepstral.cmudict ${ARGS} --phoneset=cepstral tests/phone_arpabet.upper
+check "printing to an output file" tests/phone_festvox.lower ${ARGS} "--output=phoneset=festvox file=/dev/stdout" tests/phone_arpabet.upper
+
+O=/tmp/cmudict_tools_output
+rm -rf ${O} && mkdir -p ${O}
+check "printing to several output files" tests/output-files ${ARGS} "--output=format=cmudict file=${O}/out.dict" "--output=format=json file=${O}/out.json" "--output=format=festlex phoneset=festvox file=${O}/out.scm.gz" "--output=format=sphinx file=${O}/out.sphinx.bz2" tests/phone_arpabet.upper
+gzip -dc ${O}/out.scm.gz > ${O}/out.scm
+bzip2 -dc ${O}/out.sphinx.bz2 > ${O}/out.sphinx
+check_file "output file: cmudict" tests/phone_arpabet.upper ${O}/out.dict
+check_file "output file: json" tests/phone_en-US-x-cmu_Wnone.json ${O}/out.json
+check_file "output file: festlex, gzip compressed" tests/output-files.scm ${O}/out.scm
+check_file "output file: sphinx, bzip2 compressed" tests/output-files.sphinx ${O}/out.sphinx
+rm -rf ${O}
 
 ARGS="print -Wnone --source-phoneset=arpabet --phoneset=ipa --output-encoding=utf-8"
 check "printing ipa phones, utf-8 encoding, default accent" tests/phone_en-US.ipa ${ARGS} tests/phone_arpabet.upper
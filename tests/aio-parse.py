@@ -0,0 +1,68 @@
+#!/usr/bin/python
+# coding=utf-8
+#
+# Compare the asynchronous parser with the synchronous parser.
+#
+# Copyright (C) 2017 Reece H. Dunn
+#
+# This file is part of cmudict-tools.
+#
+# cmudict-tools is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# cmudict-tools is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with cmudict-tools.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import os
+import sys
+import asyncio
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+
+from cmudicttools import cmudict
+from cmudicttools import aio
+
+configurations = [
+	('cmudict', 'tests/cmudict', {'warnings': ['all', 'no-unsorted']}),
+	('cmudict-weide', 'tests/cmudict-weide', {'warnings': ['none']}),
+	('festlex', 'tests/festlex.scm', {'warnings': ['all'], 'phoneset': 'festvox'}),
+]
+
+def result(entry):
+	word, context, phonemes, comment, meta, error = entry
+	if error:
+		return error.line_number, str(error)
+	return word, context, phonemes, comment, meta
+
+async def parse_file(filename, kwargs):
+	return [result(entry) async for entry in aio.parse(filename, chunk_size=3, **kwargs)]
+
+async def parse_stream(filename, kwargs):
+	reader = asyncio.StreamReader()
+	with open(filename, 'rb') as f:
+		reader.feed_data(f.read())
+	reader.feed_eof()
+	return [result(entry) async for entry in aio.parse(reader, chunk_size=3, **kwargs)]
+
+async def main():
+	for name, filename, kwargs in configurations:
+		expected = [result(entry) for entry in cmudict.parse(filename, **kwargs)]
+		from_file = await parse_file(filename, kwargs)
+		from_stream = await parse_stream(filename, kwargs)
+		print('{0}: {1} results, file {2}, stream {3}'.format(
+		      name, len(expected),
+		      'matches' if from_file == expected else 'differs',
+		      'matches' if from_stream == expected else 'differs'))
+
+if hasattr(asyncio, 'run'): # Python 3.7 or later
+	asyncio.run(main())
+else:
+	asyncio.get_event_loop().run_until_complete(main())
@@ -0,0 +1,74 @@
+#!/usr/bin/python
+# coding=utf-8
+#
+# Stress test parsing dictionaries concurrently with different configurations.
+#
+# Copyright (C) 2017 Reece H. Dunn
+#
+# This file is part of cmudict-tools.
+#
+# cmudict-tools is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# cmudict-tools is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with cmudict-tools.  If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import print_function
+
+import os
+import sys
+
+from multiprocessing.pool import ThreadPool
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+
+from cmudicttools import cmudict
+
+if sys.version_info[0] == 2:
+	ustr = unicode
+else:
+	ustr = str
+
+configurations = [
+	('default warnings', 'tests/cmudict', {}),
+	('cmudict', 'tests/cmudict', {'warnings': ['all', 'no-unsorted']}),
+	('cmudict-weide', 'tests/cmudict-weide', {'warnings': ['none']}),
+	('cmudict-new', 'tests/cmudict-new', {'warnings': ['no-entry-spacing']}),
+	('festlex', 'tests/festlex.scm', {'warnings': ['all'], 'phoneset': 'festvox'}),
+	('file metadata', 'tests/filemeta-metadata', {'warnings': ['all']}),
+	('sorted checks', 'tests/sorted-checks', {'warnings': ['all'], 'order_from': 1}),
+]
+
+def parse(configuration):
+	name, filename, kwargs = configuration
+	results = []
+	for word, context, phonemes, comment, meta, error in cmudict.parse(filename, **kwargs):
+		if error:
+			results.append((error.line_number, ustr(error)))
+		else:
+			results.append((word, context, phonemes and tuple(phonemes), comment, meta and sorted(meta.items())))
+	return name, results
+
+default_warnings = list(cmudict.default_warnings)
+expected = dict([parse(configuration) for configuration in configurations])
+
+tasks = configurations * 50
+pool = ThreadPool(8)
+mismatches = {}
+for name, results in pool.imap_unordered(parse, tasks):
+	if results != expected[name]:
+		mismatches[name] = mismatches.get(name, 0) + 1
+pool.close()
+pool.join()
+
+for name, _, _ in configurations:
+	errors = len([r for r in expected[name] if len(r) == 2])
+	print('{0}: {1} results, {2} errors, {3} mismatches'.format(name, len(expected[name]), errors, mismatches.get(name, 0)))
+print('default warnings unchanged: {0}'.format(cmudict.default_warnings == default_warnings))
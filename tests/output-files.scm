@@ -0,0 +1,56 @@
+("syllable" nil (s ih1 - l ax - b ax l))
+("palm" nil (aa0 aa1 aa1))
+("palm" 1 (a0 a1 a2)) ; Cepstral
+("trap" nil (ae0 ae1 ae1))
+("strut" nil (ax ah1 ah1))
+("thought" nil (ao0 ao1 ao1))
+("mouth" nil (aw0 aw1 aw1))
+("comma" nil (ax ax0))
+("letter" nil (er0 er0))
+("price" nil (ay0 ay1 ay1))
+("b" nil (bcl b))
+("ch" nil (ch))
+("d" nil (dcl d dx))
+("dh" nil (dh))
+("square" nil (ea0 ea1 ea2))
+("square" 1 (e@0 e@1 e@2)) ; Cepstral
+("dress" nil (eh0 eh1 eh1))
+("nurse" nil (er0 er1 er1))
+("face" nil (ey0 ey1 ey1))
+("f" nil (f))
+("g" nil (gcl g))
+("h" nil (hh hv hw))
+("h" 1 (h)) ; Cepstral
+("fleece" nil (iy0 iy1 iy1))
+("fleece" 1 (i0 i1 i2)) ; Cepstral/short
+("near" nil (ia0 ia1 ia2))
+("near" 1 (i@0 i@1 i@2)) ; Cepstral
+("kit" nil (ih0 ih1 ih1 ix ix0))
+("jh" nil (jh))
+("k" nil (kcl k))
+("l" nil (l el))
+("m" nil (m em))
+("n" nil (n en nx))
+("ng" nil (ng eng))
+("lot" nil (oh0 oh1 oh2))
+("force" nil (oa0 oa1 oa2)) ; Cepstral LOT vowel
+("goat" nil (ow0 ow1 ow1))
+("choice" nil (oy0 oy1 oy1))
+("p" nil (pcl p))
+("q" nil (q))
+("r" nil (r))
+("s" nil (s))
+("sh" nil (sh))
+("t" nil (tcl t))
+("th" nil (th))
+("cure" nil (ua0 ua1 ua2))
+("foot" nil (uh0 uh1 uh1))
+("goose" nil (uw0 uw1 uw1))
+("goose" 1 (u0 u1 u2)) ; Short
+("goose" 2 (ux0 ux1 ux2)) ; Scottish
+("v" nil (v))
+("w" nil (w))
+("y" nil (y))
+("y" 1 (j)) ; Cepstral
+("z" nil (z))
+("zh" nil (zh))
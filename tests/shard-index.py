@@ -0,0 +1,53 @@
+#!/usr/bin/python
+# coding=utf-8
+#
+# Check that a cached word index is rebuilt when a shard of the dictionary is
+# modified, not just the shard manifest.
+#
+# Copyright (C) 2017 Reece H. Dunn
+#
+# This file is part of cmudict-tools.
+#
+# cmudict-tools is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# cmudict-tools is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with cmudict-tools.  If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import print_function
+
+import os
+import sys
+import shutil
+import tempfile
+import subprocess
+
+root = os.path.join(os.path.dirname(os.path.realpath(__file__)), '..')
+
+def run(*args):
+	command = [sys.executable, os.path.join(root, 'cmudict-tools')] + list(args)
+	return subprocess.check_output(command).decode('utf-8').strip()
+
+directory = tempfile.mkdtemp()
+try:
+	manifest = run('split={0}'.format(directory), os.path.join(root, 'tests', 'delta-base'))
+	index = os.path.join(directory, 'words.idx')
+	print('cached: {0}'.format(run('--word-index', index, 'prefix=Z', manifest)))
+
+	shard = os.path.join(directory, 'delta-base-Z')
+	with open(shard, 'rb') as f:
+		data = f.read()
+	with open(shard, 'wb') as f:
+		f.write(data.replace(b'ZEBRA ', b'ZEBU '))
+	modified = os.path.getmtime(index) + 10
+	os.utime(shard, (modified, modified))
+	print('shard modified: {0}'.format(run('--word-index', index, 'prefix=Z', manifest)))
+finally:
+	shutil.rmtree(directory)
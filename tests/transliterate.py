@@ -0,0 +1,65 @@
+#!/usr/bin/python
+# coding=utf-8
+#
+# Compare the bulk transliteration results with converting each phoneme.
+#
+# Copyright (C) 2017 Reece H. Dunn
+#
+# This file is part of cmudict-tools.
+#
+# cmudict-tools is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# cmudict-tools is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with cmudict-tools.  If not, see <http://www.gnu.org/licenses/>.
+
+
+from __future__ import print_function
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+
+from cmudicttools import cmudict
+
+def expected(converter, pronunciations):
+	return [converter.separator.join([converter.convert(p) for p in phonemes]) for phonemes in pronunciations]
+
+def columns(text, offsets):
+	return [text[offsets[i]:offsets[i+1]] for i in range(len(offsets) - 1)]
+
+pronunciations = [phonemes for word, context, phonemes, comment, meta, error in cmudict.parse('tests/cmudict', warnings=['none']) if phonemes]
+pronunciations = pronunciations + pronunciations # cached pronunciations
+inputs = [
+	('lists', pronunciations),
+	('tuples', [tuple(phonemes) for phonemes in pronunciations]),
+	('strings', [' '.join(phonemes) for phonemes in pronunciations]),
+]
+
+for phoneset in ['ipa', 'festvox', 'cepstral']:
+	converter = cmudict.PhonemeConverter('en-US', None, phoneset, cache_size=5)
+	values = expected(cmudict.PhonemeConverter('en-US', None, phoneset), pronunciations)
+	for name, data in inputs:
+		results = [
+			('list', converter.transliterate(data, 'list')),
+			('generator', list(converter.transliterate(data, 'generator'))),
+			('columnar', columns(*converter.transliterate(data, 'columnar'))),
+			('function', cmudict.transliterate(data, phoneset=phoneset)),
+		]
+		for result, converted in results:
+			print('{0} {1} {2}: {3}'.format(phoneset, name, result, 'matches' if converted == values else 'differs'))
+
+festvox = cmudict.load_phonemes('en-US', 'festvox')
+source = [[festvox.from_arpabet.get(p.lower(), p.lower()) for p in phonemes] for phonemes in pronunciations]
+normalized = [[festvox.to_arpabet[p].upper() for p in phonemes] for phonemes in source]
+values = expected(cmudict.PhonemeConverter('en-US', None, 'ipa'), normalized)
+converted = cmudict.transliterate(source, phoneset='ipa', source='festvox')
+print('festvox source to ipa: {0}, {1} empty'.format('matches' if converted == values else 'differs', len([v for v in converted if not v])))